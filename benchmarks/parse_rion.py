@@ -0,0 +1,86 @@
+"""
+Compare the RIONParser profiles with the previous parser of RIONVibrations.
+
+Usage:
+    python -m benchmarks.parse_rion VM_001_OCT_Inst_0055_0001.rnd [...]
+    python -m benchmarks.parse_rion --duration 86400
+
+Without files, a synthetic file of the given duration is generated.
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from tracemalloc import get_traced_memory, reset_peak, start, stop
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from pandas import DataFrame, read_csv, to_datetime
+from measurements.parsers import RIONParser
+from benchmarks.synthetic import write_rion_inst
+
+def read_inferred(file)->DataFrame:
+    # Parser used by RIONVibrations before the typed profile
+    data = read_csv(file, skiprows=1)
+    data['Start Time'] = to_datetime(data['Start Time'], yearfirst=True)
+    return data
+
+PROFILES = {'inferred': read_inferred,
+            'typed': RIONParser().read,
+            'typed-pyarrow': RIONParser(engine='pyarrow').read,
+            'typed-float32': RIONParser(float32=True).read}
+
+def measure(read, file, repeat:int=3)->dict:
+    times = []
+    for _ in range(repeat):
+        begin = perf_counter()
+        read(file)
+        times.append(perf_counter() - begin)
+    start()
+    reset_peak()
+    data = read(file)
+    _, peak = get_traced_memory()
+    stop()
+    return {'seconds': min(times),
+            'peak_mb': peak / 1024**2,
+            'frame_mb': data.memory_usage(deep=True).sum() / 1024**2}
+
+def with_blank_records(file, path:Path)->Path:
+    # Copy of file with a blank record in the middle and at the end
+    lines = Path(file).read_text().splitlines()
+    blank = ',' * lines[1].count(',')
+    middle = len(lines) // 2
+    path.write_text('\n'.join(lines[:middle] + [blank] + lines[middle:] + [blank]) + '\n')
+    return path
+
+def _identical(file)->bool:
+    # Records without address belong to no fix, the typed profiles drop them
+    expected = read_inferred(file)[RIONParser.COLUMNS].dropna(subset=['Address'])
+    expected = expected.astype({'Address': 'int64'})
+    return all(RIONParser(engine=engine).read(file)[RIONParser.COLUMNS].equals(expected)
+               for engine in ('c', 'pyarrow'))
+
+def check_identical(file)->bool:
+    with TemporaryDirectory() as folder:
+        return _identical(file) and _identical(with_blank_records(file, Path(folder) / Path(file).name))
+
+def main():
+    arguments = ArgumentParser(description=__doc__)
+    arguments.add_argument('files', nargs='*')
+    arguments.add_argument('--repeat', type=int, default=3)
+    arguments.add_argument('--duration', type=float, default=6*3600,
+                           help='Seconds of the synthetic file used without files')
+    args = arguments.parse_args()
+    with TemporaryDirectory() as folder:
+        files = args.files or [write_rion_inst(Path(folder) / 'VM_001_OCT_Inst_0001_0001.rnd',
+                                               args.duration, seed=0)]
+        benchmark(files, args.repeat)
+
+def benchmark(files, repeat:int):
+    for file in files:
+        results = DataFrame({name: measure(read, file, repeat)
+                             for name, read in PROFILES.items()}).T
+        results['speedup'] = results.loc['inferred', 'seconds'] / results['seconds']
+        results['memory_reduction'] = results.loc['inferred', 'frame_mb'] / results['frame_mb']
+        print(file, '- identical to the inferred parser:', check_identical(file))
+        print(results.round(3).to_string(), end='\n\n')
+
+if __name__ == '__main__':
+    main()
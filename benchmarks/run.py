@@ -0,0 +1,136 @@
+"""
+Time each stage of the vibration pipeline on synthetic campaigns.
+
+Usage:
+    python -m benchmarks.run --durations 600 3600 --files 20 --output bench.json
+    python -m benchmarks.run --compare bench.json
+
+Results are written as JSON. With --compare, stages slower than the stored
+results by more than the tolerance are reported and the exit code is 1.
+"""
+from argparse import ArgumentParser
+from json import dump, load
+from pathlib import Path
+from platform import python_version
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import get_traced_memory, reset_peak, start, stop
+from typing import Callable, Dict, List, Optional
+from pandas import __version__ as pandas_version
+from data.data_management import export_data, replace_outliers
+from documents.documents import BaseLine
+from measurements.parsers import RIONParser
+from measurements.vibration import RIONVibrations, build_summary, get_max_pvs_row
+from benchmarks.synthetic import make_campaign
+
+PPV_COLUMNS = ['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']
+
+class StageTimer:
+    """ Accumulates time and peak traced memory of each stage. """
+    def __init__(self):
+        self.stages:Dict[str, Dict[str, float]] = {}
+
+    def run(self, name:str, function:Callable, *args, **kwargs):
+        # Peak memory is measured over what was allocated before the stage
+        current, _ = get_traced_memory()
+        reset_peak()
+        begin = perf_counter()
+        result = function(*args, **kwargs)
+        seconds = perf_counter() - begin
+        _, peak = get_traced_memory()
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'peak_mb': 0.0})
+        stage['seconds'] += seconds
+        stage['peak_mb'] = max(stage['peak_mb'], (peak - current) / 1024**2)
+        return result
+
+def load_baseline(path:Path)->BaseLine:
+    baseline = BaseLine(str(path))
+    baseline.receivers
+    return baseline
+
+def benchmark_campaign(folder:Path, files:int, duration:float, records_per_second:int)->Dict:
+    paths = make_campaign(folder, files, duration, records_per_second)
+    timer = StageTimer()
+    parser = RIONParser()
+    start()
+    try:
+        rows = {}
+        for path in paths:
+            data = timer.run('parse', parser.read, path)
+            ppvs = timer.run('group', lambda: RIONVibrations._add_pvs(RIONVibrations._group_fixes(data)))
+            timer.run('outliers', replace_outliers, ppvs, PPV_COLUMNS)
+            rows[path.name.split('_')[4]] = get_max_pvs_row(ppvs)
+        summary = build_summary(rows)
+        baseline = timer.run('baseline', load_baseline, folder / 'baseline.xlsx')
+        timer.run('receiver_lookup', baseline.find_receivers, summary.index)
+        timer.run('export', export_data, summary)
+    finally:
+        stop()
+    size = sum(path.stat().st_size for path in paths)
+    return {'files': files,
+            'duration': duration,
+            'records_per_second': records_per_second,
+            'megabytes': size / 1024**2,
+            'stages': timer.stages,
+            'total_seconds': sum(stage['seconds'] for stage in timer.stages.values())}
+
+def run(durations:List[float], files:int, records_per_second:int)->Dict:
+    results = {'python': python_version(), 'pandas': pandas_version, 'cases': {}}
+    for duration in durations:
+        with TemporaryDirectory() as folder:
+            case = benchmark_campaign(Path(folder), files, duration, records_per_second)
+        results['cases'][f'{files}x{duration:g}s'] = case
+    return results
+
+def compare(results:Dict, reference:Dict, tolerance:float, min_seconds:float=0.01)->List[str]:
+    """
+    Returns:
+        _type_: Description of every stage slower than the reference by more
+        than tolerance (0.2 is 20% slower) and by more than min_seconds, so
+        the noise of very short stages is not reported.
+    """
+    regressions = []
+    for case, result in results['cases'].items():
+        reference_case = reference['cases'].get(case)
+        if reference_case is None:
+            continue
+        for stage, values in result['stages'].items():
+            reference_stage = reference_case['stages'].get(stage)
+            if reference_stage is None or not reference_stage['seconds']:
+                continue
+            ratio = values['seconds'] / reference_stage['seconds']
+            if ratio > 1 + tolerance and values['seconds'] - reference_stage['seconds'] > min_seconds:
+                regressions.append(f'{case} {stage}: {values["seconds"]:.3f}s, '
+                                   f'{ratio:.2f}x the reference {reference_stage["seconds"]:.3f}s')
+    return regressions
+
+def main(argv:Optional[List[str]]=None)->int:
+    arguments = ArgumentParser(description=__doc__)
+    arguments.add_argument('--durations', type=float, nargs='+', default=[600, 3600],
+                           help='Seconds of measurement of each synthetic file')
+    arguments.add_argument('--files', type=int, default=10, help='Files per campaign')
+    arguments.add_argument('--records-per-second', type=int, default=10)
+    arguments.add_argument('--output', default='bench_results.json')
+    arguments.add_argument('--compare', help='Stored results to compare with')
+    arguments.add_argument('--tolerance', type=float, default=0.2,
+                           help='Relative slowdown reported as a regression')
+    arguments.add_argument('--min-seconds', type=float, default=0.01,
+                           help='Smallest slowdown in seconds reported as a regression')
+    args = arguments.parse_args(argv)
+    results = run(args.durations, args.files, args.records_per_second)
+    with open(args.output, 'w') as file:
+        dump(results, file, indent=2)
+    for case, result in results['cases'].items():
+        stages = ', '.join(f'{stage} {values["seconds"]:.3f}s/{values["peak_mb"]:.1f}MB'
+                           for stage, values in result['stages'].items())
+        print(f'{case}: {stages}')
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, load(file), args.tolerance, args.min_seconds)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,155 @@
+"""
+Synthetic RION Inst files and baseline workbooks for benchmarks.
+"""
+from pathlib import Path
+from typing import List, Literal, Optional
+from numpy import arange
+from numpy.random import default_rng
+from pandas import DataFrame, ExcelWriter, Timestamp, date_range
+from documents.documents import SheetName, get_sheet_name
+
+EXTRA_COLUMNS = ('X_RMS', 'Y_RMS', 'Z_RMS', 'X_VL', 'Y_VL', 'Z_VL')
+
+def write_rion_inst(path:str|Path,
+                    duration:float,
+                    records_per_second:int=10,
+                    start:str='2024/03/15 10:00:00',
+                    seed:Optional[int]=None,
+                    extra_columns=EXTRA_COLUMNS)->Path:
+    """
+    Write a RION Inst file as RIONVibrations reads it: a header line, then
+    'Address', 'Start Time', the '*_AP' columns and extra columns that are
+    not used by the PPV calculation.
+
+    Args:
+        path: File to write.
+        duration: Seconds of measurement.
+        records_per_second: Records per second, every 10 records are a fix.
+        start: Time of the first record.
+        seed: Seed of the random values.
+    """
+    path = Path(path)
+    rng = default_rng(seed)
+    records = max(int(duration * records_per_second), 1)
+    times = date_range(Timestamp(start.replace('/', '-')),
+                       periods=records,
+                       freq=f'{1000 // records_per_second}ms')
+    data = DataFrame({'Address': arange(1, records + 1),
+                      'Start Time': times.strftime('%Y/%m/%d %H:%M:%S.%f').str[:-3]})
+    for axis in ('X_AP', 'Y_AP', 'Z_AP'):
+        data[axis] = rng.gamma(2, 0.01, records).round(5)
+    for column in extra_columns:
+        data[column] = rng.random(records).round(4)
+    with open(path, 'w', newline='') as file:
+        file.write('VM-56 Inst\n')
+        data.to_csv(file, index=False)
+    return path
+
+def write_baseline(path:str|Path,
+                   day_memories:List[int],
+                   night_memories:List[int],
+                   measurement:Literal['Vibration', 'Noise']='Vibration')->Path:
+    """
+    Write a baseline workbook with one receiver per memory pair, the receivers
+    in column A and the memories in column E as BaseLine expects, in the
+    sheets of measurement.
+    """
+    path = Path(path)
+    receivers = [f'R{number:03d}' for number in range(1, len(day_memories) + 1)]
+    def sheet(memories):
+        return DataFrame({'Receptor': receivers,
+                          'Este': 0.0,
+                          'Norte': 0.0,
+                          'Fecha': '',
+                          'Memoria': memories})
+    with ExcelWriter(path, engine='xlsxwriter') as writer:
+        DataFrame({'Proyecto': ['Synthetic']}).to_excel(writer, sheet_name=SheetName.PROJECT.value, index=False)
+        day_sheet, night_sheet = get_sheet_name(measurement)
+        sheet(day_memories).to_excel(writer, sheet_name=day_sheet, index=False)
+        sheet(night_memories).to_excel(writer, sheet_name=night_sheet, index=False)
+    return path
+
+def make_campaign(folder:str|Path,
+                  files:int,
+                  duration:float,
+                  records_per_second:int=10,
+                  seed:int=0)->List[Path]:
+    """
+    Write a campaign with the Auto_XXXX/Auto_Inst/*.rnd layout and a baseline
+    workbook. Odd files are night measurements of the receiver of the
+    previous file.
+
+    Returns:
+        _type_: Paths of the Inst files.
+    """
+    folder = Path(folder)
+    paths = []
+    for index in range(files):
+        memory = index + 1
+        inst_folder = folder / f'Auto_{memory:04d}' / 'Auto_Inst'
+        inst_folder.mkdir(parents=True, exist_ok=True)
+        start = '2024/03/15 10:00:00' if index % 2 == 0 else '2024/03/15 22:00:00'
+        paths.append(write_rion_inst(inst_folder / f'VM_001_OCT_Inst_{memory:04d}_0001.rnd',
+                                     duration,
+                                     records_per_second,
+                                     start=start,
+                                     seed=seed + index))
+    day_memories = list(range(1, files + 1, 2))
+    night_memories = list(range(2, files + 2, 2))[:len(day_memories)]
+    write_baseline(folder / 'baseline.xlsx', day_memories, night_memories)
+    return paths
+
+# 1/3 octave bands of the RION VM-56 octave analysis, in Hz
+THIRD_OCTAVE_BANDS = (1, 1.25, 1.6, 2, 2.5, 3.15, 4, 5, 6.3, 8, 10,
+                      12.5, 16, 20, 25, 31.5, 40, 50, 63, 80)
+
+def write_rion_calc(path:str|Path,
+                    duration:float,
+                    records_per_second:int=1,
+                    start:str='2024/03/15 10:00:00',
+                    seed:Optional[int]=None,
+                    bands=THIRD_OCTAVE_BANDS)->Path:
+    """
+    Write a RION OCT Calc file as measurements.frequency reads it: a header
+    line, then 'Address', 'Start Time' and one level column per axis and band
+    named like 'X_31.5Hz'.
+    """
+    path = Path(path)
+    rng = default_rng(seed)
+    records = max(int(duration * records_per_second), 1)
+    times = date_range(Timestamp(start.replace('/', '-')),
+                       periods=records,
+                       freq=f'{1000 // records_per_second}ms')
+    data = DataFrame({'Address': arange(1, records + 1),
+                      'Start Time': times.strftime('%Y/%m/%d %H:%M:%S.%f').str[:-3]})
+    for axis in ('X', 'Y', 'Z'):
+        for band in bands:
+            data[f'{axis}_{band}Hz'] = rng.normal(60, 5, records).round(1)
+    with open(path, 'w', newline='') as file:
+        file.write('VM-56 OCT Calc\n')
+        data.to_csv(file, index=False)
+    return path
+
+def write_noise_log(path:str|Path,
+                    duration:float,
+                    records_per_second:float=1,
+                    start:str='2024/03/15 10:00:00',
+                    seed:Optional[int]=None,
+                    level_column:str='Main')->Path:
+    """
+    Write a sound level meter log as measurements.noise reads it: a header
+    line, then 'Address', 'Start Time' and the level of each record in dB.
+    """
+    path = Path(path)
+    rng = default_rng(seed)
+    records = max(int(duration * records_per_second), 1)
+    times = date_range(Timestamp(start.replace('/', '-')),
+                       periods=records,
+                       freq=f'{int(1000 / records_per_second)}ms')
+    data = DataFrame({'Address': arange(1, records + 1),
+                      'Start Time': times.strftime('%Y/%m/%d %H:%M:%S'),
+                      level_column: rng.normal(55, 6, records).round(1)})
+    with open(path, 'w', newline='') as file:
+        file.write('NL-52 SLM\n')
+        data.to_csv(file, index=False)
+    return path
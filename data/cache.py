@@ -0,0 +1,240 @@
+from collections import OrderedDict
+from hashlib import sha256
+from os import replace, utime
+from pathlib import Path
+from shutil import rmtree
+from sys import getsizeof
+from threading import Lock, RLock
+from typing import Dict, Hashable, Optional
+from uuid import uuid4
+from pandas import DataFrame, Series, read_parquet
+
+BLOCK_SIZE = 1 << 20
+
+def file_digest(file, version:str='')->str:
+    """
+    Hash the content of a file in blocks, so large files are never fully
+    loaded in memory.
+
+    Args:
+        file: Path or file object. File objects are rewound after hashing.
+        version: Added to the hash so results of older parsers are not reused.
+
+    Returns:
+        _type_: Hexadecimal sha256 digest.
+    """
+    digest = sha256(version.encode())
+    if isinstance(file, (str, Path)):
+        with open(file, 'rb') as stream:
+            for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    file.seek(0)
+    for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+def file_size(file)->int:
+    if isinstance(file, (str, Path)):
+        return Path(file).stat().st_size
+    if hasattr(file, 'size'):
+        return file.size
+    return len(file.getvalue())
+
+class ParquetCache:
+    """
+    Content addressed cache of parsed tables stored as Parquet files.
+
+    Each entry is a folder named after the content hash of the source file,
+    with one Parquet file per table. When the folder grows over max_bytes the
+    least recently used entries are removed.
+
+    The cache can be shared by several threads, entries removed by another
+    thread or process are treated as missing.
+    """
+    def __init__(self, directory:str|Path, max_bytes:int=2*1024**3):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = RLock()
+
+    def _path(self, key:str, name:str)->Path:
+        return self.directory / key / f'{name}.parquet'
+
+    def get(self, key:str, name:str, source_size:int=0)->Optional[DataFrame]:
+        """
+        Returns:
+            _type_: The cached table, or None if it is not in the cache.
+        """
+        path = self._path(key, name)
+        try:
+            table = read_parquet(path)
+        except (FileNotFoundError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # Mark the entry as recently used
+            utime(path.parent)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += source_size
+        return table
+
+    def put(self, key:str, name:str, table:DataFrame):
+        path = self._path(key, name)
+        # Written outside the entries, so eviction never removes a table being written
+        temp_path = self.directory / f'.{uuid4().hex}.tmp'
+        try:
+            table.to_parquet(temp_path)
+            with self._lock:
+                path.parent.mkdir(exist_ok=True)
+                replace(temp_path, path)
+                self.evict()
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _stat(path:Path):
+        try:
+            return path.stat()
+        except FileNotFoundError:
+            return None
+
+    def _entry_size(self, entry:Path)->int:
+        stats = [self._stat(path) for path in entry.glob('*.parquet')]
+        return sum(stat.st_size for stat in stats if stat is not None)
+
+    @property
+    def size(self)->int:
+        return sum(self._entry_size(entry) for entry in self.directory.iterdir() if entry.is_dir())
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for entry in self.directory.iterdir():
+                stat = self._stat(entry)
+                if stat is not None and entry.is_dir():
+                    entries.append((stat.st_mtime, entry, self._entry_size(entry)))
+            total = sum(size for _, _, size in entries)
+            for _, entry, size in sorted(entries, key=lambda entry: entry[0]):
+                if total <= self.max_bytes:
+                    break
+                rmtree(entry, ignore_errors=True)
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            for entry in self.directory.iterdir():
+                if entry.is_dir():
+                    rmtree(entry, ignore_errors=True)
+
+    @property
+    def hit_rate(self)->float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    @property
+    def stats(self)->dict:
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate,
+                'bytes_saved': self.bytes_saved,
+                'size': self.size,
+                'max_bytes': self.max_bytes}
+
+def object_size(value)->int:
+    """ Approximate memory of a cached value, tables are measured with their content. """
+    if isinstance(value, (DataFrame, Series)):
+        return int(value.memory_usage(deep=True).sum())
+    return getsizeof(value)
+
+class MemoryCache:
+    """
+    Process-wide cache of objects in memory, keyed by content hash.
+
+    It is shared by every session of the app, so a file or workbook opened by
+    several users is only processed once. The least recently used entries
+    are dropped when there are more than max_entries or they use more than
+    max_bytes. Cached values are shared, callers must not modify them.
+    """
+    def __init__(self, max_entries:int=256, max_bytes:int=512*1024**2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries:OrderedDict = OrderedDict()
+        self._sizes:Dict[Hashable, int] = {}
+        self._size = 0
+        self._lock = Lock()
+
+    def __contains__(self, key:Hashable)->bool:
+        return key in self._entries
+
+    def __len__(self)->int:
+        return len(self._entries)
+
+    def get(self, key:Hashable):
+        """
+        Returns:
+            _type_: The cached value, or None if it is not in the cache.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key:Hashable, value, size:Optional[int]=None):
+        """
+        Args:
+            size: Bytes used by value, measured with object_size if not given.
+        """
+        size = object_size(value) if size is None else size
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key:Hashable):
+        if key in self._entries:
+            del self._entries[key]
+            self._size -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._size = 0
+
+    @property
+    def size(self)->int:
+        return self._size
+
+    @property
+    def hit_rate(self)->float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    @property
+    def stats(self)->dict:
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'size': self.size,
+                'max_bytes': self.max_bytes}
@@ -1,5 +1,10 @@
-from pandas import Series, DataFrame, ExcelWriter
+from pandas import Series, DataFrame
 from io import BytesIO
+from pathlib import Path
+from numpy import where
+from typing import Dict, Iterable, Optional
+from data.quantiles import TDigest
+from data.export import MIME_TYPES, export_details, export_table
 
 def get_outliers(data:Series, k_factor:int=1.5)->Series:
     seventy_fifth = data.quantile(0.75)
@@ -27,8 +32,118 @@ def outliers_to_median(data:Series, outliers:Series=None)->Series:
     data_copy.loc[outliers.index] = median
     return data_copy
 
+def get_outlier_limits(data:DataFrame, k_factor:float=1.5)->DataFrame:
+    """
+    Compute the IQR limits and the median of every column in one pass.
+
+    Returns:
+        _type_: DataFrame with rows 'lower', 'median' and 'upper' and one
+        column per column of data.
+    """
+    quantiles = data.quantile([0.25, 0.5, 0.75])
+    twenty_fifth = quantiles.loc[0.25]
+    seventy_fifth = quantiles.loc[0.75]
+    iqr = seventy_fifth - twenty_fifth
+    return DataFrame({'lower': twenty_fifth - (k_factor * iqr),
+                      'median': quantiles.loc[0.5],
+                      'upper': seventy_fifth + (k_factor * iqr)}).T
+
+class StreamingOutlierLimits:
+    """
+    Approximate outlier limits of data that is read in chunks.
+
+    Each column is summarized with a TDigest, so the limits can be computed
+    without holding all the values in memory.
+    """
+    def __init__(self, columns:Iterable[str], compression:int=200):
+        self.digests = {column: TDigest(compression) for column in columns}
+
+    def update(self, data:DataFrame):
+        for column, digest in self.digests.items():
+            digest.update(data[column].to_numpy())
+
+    def limits(self, k_factor:float=1.5)->DataFrame:
+        """
+        Returns:
+            _type_: Same layout as get_outlier_limits.
+        """
+        limits = {}
+        for column, digest in self.digests.items():
+            twenty_fifth = digest.quantile(0.25)
+            seventy_fifth = digest.quantile(0.75)
+            iqr = seventy_fifth - twenty_fifth
+            limits[column] = {'lower': twenty_fifth - (k_factor * iqr),
+                              'median': digest.quantile(0.5),
+                              'upper': seventy_fifth + (k_factor * iqr)}
+        return DataFrame(limits)
+
+def replace_outliers(data:DataFrame,
+                     columns:Optional[Iterable[str]]=None,
+                     k_factor:float=1.5,
+                     limits:Optional[DataFrame]=None,
+                     inplace:bool=False)->DataFrame:
+    """
+    Replace the outliers of several columns with the median of each column.
+
+    Same criteria as get_outliers and outliers_to_median, applied to all the
+    columns at once.
+
+    Args:
+        data: DataFrame with numeric columns.
+        columns: Columns to process, all of them by default.
+        k_factor: IQR factor of the outlier limits.
+        limits: Limits from get_outlier_limits or StreamingOutlierLimits. They
+            are computed from data if not given.
+        inplace: Replace the columns of data instead of those of a shallow
+            copy. By default data is left unchanged.
+
+    Returns:
+        _type_: DataFrame with outliers replaced by median values. Only the
+        columns with outliers get a new array, one column at a time, and
+        every column keeps its dtype. Integer columns get the rounded median.
+    """
+    columns = list(columns) if columns is not None else list(data.columns)
+    if limits is None:
+        limits = get_outlier_limits(data[columns], k_factor)
+    if not inplace:
+        # The columns without outliers are shared with data
+        data = data.copy(deep=False)
+    for column in columns:
+        values = data[column].to_numpy()
+        outliers = (values < limits.at['lower', column]) | (values > limits.at['upper', column])
+        if not outliers.any():
+            continue
+        median = limits.at['median', column]
+        if values.dtype.kind in 'iu':
+            median = round(median)
+        data[column] = where(outliers, median, values).astype(values.dtype, copy=False)
+    return data
+
 def export_data(df:DataFrame):
-    buffer = BytesIO()
-    with ExcelWriter(buffer, engine='xlsxwriter') as writer:
-        df.to_excel(writer, sheet_name='Vibration Summary')
-    return buffer
+    return BytesIO(export_table(df, 'xlsx'))
+
+def save_data(df:DataFrame,
+              path:str|Path,
+              sheet_name:str='Vibration Summary',
+              details:Optional[Dict[str, DataFrame]]=None,
+              events:Optional[DataFrame]=None):
+    """
+    Write a table to disk, the format is chosen by the extension of path:
+    '.xlsx', '.csv' or '.parquet'.
+
+    Args:
+        details: PPV tables by file number. They are sheets of the workbook
+            in xlsx, or a second file named '<stem>_detail' otherwise.
+        events: Table of events over the limits, the 'Events' sheet of the
+            workbook in xlsx, or a file named '<stem>_events' otherwise.
+    """
+    path = Path(path)
+    file_format = path.suffix.lstrip('.')
+    if file_format not in MIME_TYPES:
+        raise ValueError(f'Unsupported output format "{path.suffix}"')
+    sheets = {**({'Events': events} if events is not None else {}), **(details or {})}
+    path.write_bytes(export_table(df, file_format, sheets or None, sheet_name))
+    if details and file_format != 'xlsx':
+        path.with_name(f'{path.stem}_detail{path.suffix}').write_bytes(export_details(details, file_format))
+    if events is not None and file_format != 'xlsx':
+        path.with_name(f'{path.stem}_events{path.suffix}').write_bytes(export_table(events, file_format))
@@ -0,0 +1,101 @@
+"""
+Reduce long series to a number of points a chart can display, keeping peaks.
+"""
+from typing import Iterable, Literal, Optional
+from numpy import absolute, arange, argmax, asarray, ceil, concatenate, full, inf, isnan, ndarray, \
+    unique, where
+from pandas import DataFrame
+
+def min_max_indices(values:Iterable[float], buckets:int)->ndarray:
+    """
+    Split values into buckets of equal length and keep the position of the
+    minimum and the maximum of each bucket, so no peak is dropped.
+
+    Returns:
+        _type_: Sorted positions, at most 2*buckets.
+    """
+    values = asarray(values, dtype=float)
+    size = len(values)
+    if size <= 2*buckets:
+        return arange(size)
+    length = int(ceil(size / buckets))
+    padding = length*buckets - size
+    maxima = concatenate([where(isnan(values), -inf, values), full(padding, -inf)]).reshape(buckets, length)
+    minima = concatenate([where(isnan(values), inf, values), full(padding, inf)]).reshape(buckets, length)
+    offsets = arange(buckets)*length
+    indices = concatenate([offsets + maxima.argmax(axis=1),
+                           offsets + minima.argmin(axis=1)])
+    return unique(indices[indices < size])
+
+def lttb_indices(x:Iterable[float], y:Iterable[float], threshold:int)->ndarray:
+    """
+    Largest-Triangle-Three-Buckets: keep the point of each bucket that forms
+    the largest triangle with the point kept before and the average of the
+    next bucket. It follows the shape of the series with threshold points.
+
+    Returns:
+        _type_: Sorted positions, threshold of them.
+    """
+    x = asarray(x, dtype=float)
+    y = asarray(y, dtype=float)
+    size = len(y)
+    if threshold >= size or threshold < 3:
+        return arange(size)
+    every = (size - 2) / (threshold - 2)
+    indices = [0]
+    selected = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket*every) + 1
+        end = int((bucket + 1)*every) + 1
+        next_end = min(int((bucket + 2)*every) + 1, size)
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean()
+        areas = absolute((x[selected] - average_x)*(y[start:end] - y[selected])
+                         - (x[selected] - x[start:end])*(average_y - y[selected]))
+        selected = start + int(argmax(where(isnan(areas), -1, areas)))
+        indices.append(selected)
+    indices.append(size - 1)
+    return asarray(indices)
+
+def downsample_indices(data:DataFrame,
+                       column:str,
+                       points:int,
+                       method:Literal['minmax', 'lttb']='minmax',
+                       x:Optional[str]=None)->ndarray:
+    """
+    Positions of the rows kept to display column with about points points.
+    LTTB positions always include the maximum of the column.
+
+    Args:
+        data: Table with the series.
+        column: Column to downsample.
+        points: Number of points to keep, e.g. the width of the chart in pixels.
+        method: 'minmax' keeps the extremes of every bucket, 'lttb' the shape.
+        x: Column of the x axis, the index by default. Only used by 'lttb'.
+    """
+    values = data[column].to_numpy(dtype=float)
+    if method == 'minmax':
+        return min_max_indices(values, max(points // 2, 1))
+    x_values = data.index if x is None else data[x]
+    x_values = asarray(x_values.astype('int64') if x_values.dtype.kind == 'M' else x_values, dtype=float)
+    indices = lttb_indices(x_values, values, points)
+    if len(values) and not isnan(values).all():
+        indices = unique(concatenate([indices, [int(argmax(where(isnan(values), -inf, values)))]]))
+    return indices
+
+def downsample(data:DataFrame,
+               columns:Iterable[str],
+               points:int,
+               method:Literal['minmax', 'lttb']='minmax',
+               x:Optional[str]=None)->DataFrame:
+    """
+    Keep the rows selected for any of the columns, so all the series of a
+    chart share the x values and the peaks of every column are kept. The
+    points are split between the columns, about points rows are kept in total.
+    """
+    columns = list(columns)
+    column_points = max(points // max(len(columns), 1), 2)
+    indices = [downsample_indices(data, column, column_points, method, x) for column in columns]
+    if not indices:
+        return data
+    return data.iloc[unique(concatenate(indices))]
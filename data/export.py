@@ -0,0 +1,114 @@
+"""
+Export summaries and per-file PPV tables as xlsx, CSV or Parquet.
+
+Workbooks are written row by row with xlsxwriter's constant_memory mode, so
+only one row is held in memory besides the tables themselves.
+"""
+from io import BytesIO
+from typing import Dict, Literal, Optional
+from pandas import DataFrame, Timestamp, concat, isna
+from xlsxwriter import Workbook
+from data.profiling import span
+
+Format = Literal['xlsx', 'csv', 'parquet']
+MIME_TYPES = {'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+              'csv': 'text/csv',
+              'parquet': 'application/vnd.apache.parquet'}
+EXCEL_MAX_ROWS = 1_048_576
+SHEET_NAME_LENGTH = 31
+
+def _cell(value):
+    # Values xlsxwriter can write, blanks for missing values
+    if value is None or (not isinstance(value, str) and isna(value)):
+        return None
+    if isinstance(value, Timestamp):
+        return value.to_pydatetime()
+    return value
+
+def _write_sheet(workbook:Workbook, name:str, df:DataFrame):
+    """
+    Write df in one or more sheets, Excel sheets are limited to EXCEL_MAX_ROWS.
+    """
+    header = [df.index.name or ''] + [str(column) for column in df.columns]
+    rows_per_sheet = EXCEL_MAX_ROWS - 1
+    for part, start in enumerate(range(0, max(len(df), 1), rows_per_sheet)):
+        sheet_name = name if part == 0 else f'{name[:SHEET_NAME_LENGTH - 6]} ({part + 1})'
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, header)
+        for row, values in enumerate(df.iloc[start:start + rows_per_sheet].itertuples(name=None), start=1):
+            worksheet.write_row(row, 0, [_cell(value) for value in values])
+
+def _sheet_name(name:str, used:set)->str:
+    sheet_name = str(name)[:SHEET_NAME_LENGTH]
+    number = 2
+    while sheet_name in used:
+        suffix = f' ({number})'
+        sheet_name = str(name)[:SHEET_NAME_LENGTH - len(suffix)] + suffix
+        number += 1
+    used.add(sheet_name)
+    return sheet_name
+
+def to_xlsx(summary:DataFrame,
+            details:Optional[Dict[str, DataFrame]]=None,
+            sheet_name:str='Vibration Summary')->bytes:
+    """
+    Returns:
+        _type_: Workbook with the summary and, if given, one sheet per file
+        with its PPV values.
+    """
+    buffer = BytesIO()
+    # Excel has no time zones, aware datetimes are written in their own local time
+    workbook = Workbook(buffer, {'constant_memory': True,
+                                 'remove_timezone': True,
+                                 'default_date_format': 'yyyy-mm-dd hh:mm:ss.000'})
+    used = set()
+    _write_sheet(workbook, _sheet_name(sheet_name, used), summary)
+    for name, detail in (details or {}).items():
+        _write_sheet(workbook, _sheet_name(name, used), detail)
+    workbook.close()
+    return buffer.getvalue()
+
+def to_csv(df:DataFrame)->bytes:
+    return df.to_csv().encode('utf-8')
+
+def to_parquet(df:DataFrame)->bytes:
+    buffer = BytesIO()
+    df.to_parquet(buffer)
+    return buffer.getvalue()
+
+def details_table(details:Dict[str, DataFrame], key:str='File Number')->DataFrame:
+    """
+    Returns:
+        _type_: The PPV tables of all files in one table, with the file in
+        the first level of the index.
+    """
+    return concat(details, names=[key])
+
+def export_table(summary:DataFrame,
+                 file_format:Format='xlsx',
+                 details:Optional[Dict[str, DataFrame]]=None,
+                 sheet_name:str='Vibration Summary')->bytes:
+    """
+    Args:
+        summary: Summary table.
+        file_format: 'xlsx', 'csv' or 'parquet'.
+        details: PPV tables by file number. In xlsx each one is a sheet of the
+            workbook. CSV and Parquet hold a single table, use export_details
+            for them.
+        sheet_name: Sheet of the summary in xlsx.
+
+    Returns:
+        _type_: Bytes of the file.
+    """
+    with span('export'):
+        if file_format == 'xlsx':
+            return to_xlsx(summary, details, sheet_name)
+        if file_format == 'csv':
+            return to_csv(summary)
+        if file_format == 'parquet':
+            return to_parquet(summary)
+    raise ValueError(f'Unsupported export format "{file_format}"')
+
+def export_details(details:Dict[str, DataFrame], file_format:Format='csv')->bytes:
+    """ Export the PPV tables of all files as one table, see details_table. """
+    return export_table(details_table(details), file_format)
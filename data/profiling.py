@@ -0,0 +1,148 @@
+"""
+Lightweight timing and memory spans for the processing pipeline.
+
+Spans are only recorded while a Profiler is active in the current thread.
+Otherwise span returns a shared no-op context manager, so instrumented code
+costs one attribute lookup per span.
+"""
+from contextlib import contextmanager, nullcontext
+from json import dumps
+from logging import getLogger
+from threading import Lock, local
+from time import perf_counter
+from tracemalloc import get_traced_memory, is_tracing, reset_peak, start as start_tracing, \
+    stop as stop_tracing
+from typing import Dict, List, Optional
+from pandas import DataFrame
+
+logger = getLogger('acoustic_data_analysis.profiling')
+
+_NULL_SPAN = nullcontext()
+_state = local()
+# tracemalloc is process-wide, so only one profiler at a time tracks memory
+_memory_lock = Lock()
+_memory_profiler = None
+
+def file_label(file)->Optional[str]:
+    """ Name used to group the spans of a file. """
+    if file is None:
+        return None
+    name = getattr(file, 'name', file)
+    return str(name).replace('\\', '/').split('/')[-1]
+
+class Profiler:
+    """
+    Collects the spans of one run.
+
+    Args:
+        track_memory: Record the peak memory allocated in each span with
+            tracemalloc. It slows down the run noticeably. The peaks are
+            process-wide, so while another profiler of the process tracks
+            memory this one only records times, and memory_refused is set.
+    """
+    def __init__(self, track_memory:bool=False):
+        self.track_memory = track_memory
+        self.memory_refused = False
+        self.spans:List[Dict] = []
+        self._stack:List[list] = []
+        self._started_tracing = False
+
+    def start(self):
+        """ Make this the active profiler of the current thread. """
+        global _memory_profiler
+        if self.track_memory:
+            with _memory_lock:
+                if _memory_profiler is not None and _memory_profiler is not self:
+                    # Resetting the peak would corrupt the spans of the other profiler
+                    self.track_memory = False
+                    self.memory_refused = True
+                else:
+                    _memory_profiler = self
+                    if not is_tracing():
+                        start_tracing()
+                        self._started_tracing = True
+        _state.profiler = self
+        return self
+
+    def stop(self):
+        global _memory_profiler
+        if active_profiler() is self:
+            _state.profiler = None
+        with _memory_lock:
+            if _memory_profiler is self:
+                _memory_profiler = None
+            if self._started_tracing:
+                stop_tracing()
+                self._started_tracing = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextmanager
+    def span(self, stage:str, file=None):
+        if self.track_memory:
+            current, peak = get_traced_memory()
+            if self._stack:
+                # The peak of the parent span until now is lost on reset
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            reset_peak()
+            self._stack.append([current, current])
+        begin = perf_counter()
+        try:
+            yield
+        finally:
+            record = {'stage': stage,
+                      'file': file_label(file),
+                      'seconds': perf_counter() - begin}
+            if self.track_memory:
+                start_memory, child_peak = self._stack.pop()
+                _, peak = get_traced_memory()
+                peak = max(peak, child_peak)
+                record['peak_mb'] = (peak - start_memory) / 1024**2
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], peak)
+            self.spans.append(record)
+
+    def extend(self, spans:List[Dict]):
+        """ Add spans recorded elsewhere, e.g. in a worker process. """
+        self.spans.extend(spans)
+
+    def table(self)->DataFrame:
+        return DataFrame(self.spans, columns=['stage', 'file', 'seconds', 'peak_mb'])
+
+    def summary(self)->DataFrame:
+        """
+        Returns:
+            _type_: Total seconds, number of spans and largest peak memory by stage.
+        """
+        return self.table().groupby('stage').agg(seconds=('seconds', 'sum'),
+                                                 count=('seconds', 'size'),
+                                                 peak_mb=('peak_mb', 'max')
+                                                 ).sort_values('seconds', ascending=False)
+
+    def log(self, run:Optional[str]=None):
+        """ Write one JSON line per span to the profiling logger. """
+        for record in self.spans:
+            logger.info(dumps({'run': run, **record}))
+
+def active_profiler()->Optional[Profiler]:
+    return getattr(_state, 'profiler', None)
+
+def deactivate():
+    """ Stop the active profiler of the current thread, if any. """
+    profiler = active_profiler()
+    if profiler is not None:
+        profiler.stop()
+
+def span(stage:str, file=None):
+    """
+    Context manager that records the time of a stage of the pipeline in the
+    active Profiler, and does nothing when there is none.
+    """
+    profiler = getattr(_state, 'profiler', None)
+    if profiler is None:
+        return _NULL_SPAN
+    return profiler.span(stage, file)
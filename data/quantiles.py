@@ -0,0 +1,62 @@
+from math import pi
+from typing import Iterable
+from numpy import add, arcsin, argsort, asarray, concatenate, cumsum, empty, flatnonzero, floor, \
+    inf, interp, isnan, ones, r_
+
+class TDigest:
+    """
+    Approximate quantiles of a stream of values (merging t-digest).
+
+    Values are kept as weighted centroids. Centroids are small near the
+    tails and larger around the median, so the digest stays bounded by about
+    compression centroids whatever the number of values. Updates and merges
+    are vectorized over whole chunks.
+    """
+    def __init__(self, compression:int=200):
+        self.compression = compression
+        self.means = empty(0)
+        self.weights = empty(0)
+        self.min = inf
+        self.max = -inf
+
+    @property
+    def count(self)->float:
+        return self.weights.sum()
+
+    def update(self, values:Iterable[float]):
+        values = asarray(values, dtype=float).ravel()
+        values = values[~isnan(values)]
+        if not values.size:
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(concatenate([self.means, values]),
+                       concatenate([self.weights, ones(values.size)]))
+
+    def merge(self, other:'TDigest'):
+        if not other.count:
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(concatenate([self.means, other.means]),
+                       concatenate([self.weights, other.weights]))
+
+    def _compress(self, means, weights):
+        order = argsort(means, kind='mergesort')
+        means = means[order]
+        weights = weights[order]
+        # Quantile at the middle of each centroid, mapped with the k1 scale function
+        q = (cumsum(weights) - weights/2) / weights.sum()
+        k = floor(self.compression / (2*pi) * arcsin(2*q - 1))
+        starts = flatnonzero(r_[True, k[1:] != k[:-1]])
+        self.weights = add.reduceat(weights, starts)
+        self.means = add.reduceat(means*weights, starts) / self.weights
+
+    def quantile(self, q:float)->float:
+        if not self.count:
+            return float('nan')
+        total = self.count
+        centers = cumsum(self.weights) - self.weights/2
+        return float(interp(q*total,
+                            r_[0, centers, total],
+                            r_[self.min, self.means, self.max]))
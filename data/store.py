@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from pathlib import Path
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import RLock
+from typing import Dict, Optional
+from weakref import finalize
+from pandas import DataFrame
+from pyarrow import Table, feather
+
+class MeasurementStore:
+    """
+    Frames kept in memory up to a budget shared by every user of the store.
+
+    When the frames in memory exceed max_bytes the least recently used ones
+    are spilled to uncompressed Arrow files on local disk, and read back with
+    a memory map the next time they are requested. Spill files are removed
+    with their frame, or with the store.
+    """
+    def __init__(self, max_bytes:int=512*1024**2, directory:Optional[str|Path]=None):
+        """
+        Args:
+            max_bytes: Memory budget of the frames held in memory.
+            directory: Where the spill folder is created, the temporary
+                folder of the system by default.
+        """
+        self.max_bytes = max_bytes
+        if directory is not None:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+        self.directory = Path(mkdtemp(prefix='measurements-', dir=directory))
+        self.hits = 0
+        self.reloads = 0
+        self.spills = 0
+        self._frames:OrderedDict = OrderedDict()
+        self._sizes:Dict[str, int] = {}
+        self._spilled:Dict[str, Path] = {}
+        self._memory = 0
+        self._lock = RLock()
+        self._cleanup = finalize(self, rmtree, self.directory, True)
+
+    def __contains__(self, key:str)->bool:
+        return key in self._frames or key in self._spilled
+
+    def put(self, key:str, frame:DataFrame):
+        with self._lock:
+            self.discard(key)
+            self._keep(key, frame)
+            self._spill()
+
+    def get(self, key:str)->Optional[DataFrame]:
+        """
+        Returns:
+            _type_: The frame stored under key, read back from disk if it was
+            spilled, or None if there is none.
+        """
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return self._frames[key]
+            path = self._spilled.get(key)
+            if path is None:
+                return None
+            frame = feather.read_table(path, memory_map=True).to_pandas()
+            self.reloads += 1
+            self._keep(key, frame)
+            self._spill()
+            return frame
+
+    def discard(self, *keys:str):
+        with self._lock:
+            for key in keys:
+                if key in self._frames:
+                    del self._frames[key]
+                    self._memory -= self._sizes.pop(key)
+                path = self._spilled.pop(key, None)
+                if path is not None:
+                    path.unlink(missing_ok=True)
+
+    def clear(self):
+        with self._lock:
+            self.discard(*list(self._frames), *list(self._spilled))
+
+    def _keep(self, key:str, frame:DataFrame):
+        size = int(frame.memory_usage(deep=True).sum())
+        self._frames[key] = frame
+        self._sizes[key] = size
+        self._memory += size
+
+    def _spill(self):
+        # Least recently used first, a spilled frame that was read back
+        # still has its file so it is not written again
+        while self._memory > self.max_bytes and self._frames:
+            key, frame = self._frames.popitem(last=False)
+            self._memory -= self._sizes.pop(key)
+            if key not in self._spilled:
+                path = self.directory / f'{key}.arrow'
+                feather.write_feather(Table.from_pandas(frame), path, compression='uncompressed')
+                self._spilled[key] = path
+                self.spills += 1
+
+    @property
+    def memory_bytes(self)->int:
+        return self._memory
+
+    @property
+    def disk_bytes(self)->int:
+        return sum(path.stat().st_size for path in list(self._spilled.values()) if path.exists())
+
+    @property
+    def stats(self)->dict:
+        return {'frames': len(self._frames),
+                'on_disk': len(self._spilled),
+                'memory_bytes': self.memory_bytes,
+                'disk_bytes': self.disk_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'reloads': self.reloads,
+                'spills': self.spills}
@@ -1,7 +1,9 @@
-from pandas import DataFrame, merge, read_excel
+from pandas import DataFrame, Series, merge, read_excel
 from enum import Enum
-from typing import Literal, Optional, List
+from typing import Dict, Iterable, Literal, Optional, List, Tuple
 from streamlit.runtime.uploaded_file_manager import UploadedFile
+from data.cache import MemoryCache, file_digest, file_size, object_size
+from data.profiling import span
 
 class NoFilesError(Exception):
     pass
@@ -31,15 +33,29 @@ def get_sheet_name(measurement:Literal['Vibration', 'Noise']):
     if measurement=='Vibration':
         return SheetName.VIB_DAY.value, SheetName.VIB_NIGHT.value
 
+def zero_pad(memories:Series)->Series:
+    return memories.astype('int64').astype(str).str.zfill(4)
+
 class BaseLine:
     INDEX_NAME = 'Receivers'
     RECEIVERS_COL = 'A'
     MEMORIES_COL = 'E'
     def __init__(self, path:str, 
                  receivers_col:Optional[str]=None, 
-                 memories_col:Optional[str]=None):
+                 memories_col:Optional[str]=None,
+                 measurement:Literal['Vibration', 'Noise']='Vibration'):
+        """
+        Args:
+            path: Path or file object of the baseline workbook.
+            receivers_col: Excel column with the receivers names.
+            memories_col: Excel column with the memory numbers.
+            measurement: Which sheets of the workbook have the memories,
+                see get_sheet_name.
+        """
         self.path = path
+        self.measurement = measurement
         self._receivers = None
+        self._memory_index = None
         self._modify_columns(receivers_col, memories_col)
     
     def _modify_columns(self, receivers_col:str|None, memories_col:str|None):
@@ -48,46 +64,106 @@ class BaseLine:
         if memories_col:
             self.MEMORIES_COL = memories_col
 
-    def _read_data(self, sheet_name:SheetName)->DataFrame:
+    def _read_sheets(self, sheet_names:List[str])->Dict[str, DataFrame]:
+        # All sheets are read from a single open of the workbook
+        if hasattr(self.path, 'seek'):
+            self.path.seek(0)
         return read_excel(self.path, 
-                          sheet_name, 
+                          sheet_names, 
                           index_col=0, 
                           usecols="{},{}".format(self.RECEIVERS_COL,
                                                  self.MEMORIES_COL))
+
+    def _read_data(self, sheet_name:SheetName)->DataFrame:
+        return self._read_sheets([sheet_name])[sheet_name]
     
     def _merge_data(self, measurement:Optional[Literal['Vibration', 'Noise']]='Vibration')->DataFrame:
+        # Workbooks are shared by content with load_baseline, not here
         day_sheetName, night_sheetName = get_sheet_name(measurement)
-        day:DataFrame = self._read_data(day_sheetName).dropna()
-        night:DataFrame = self._read_data(night_sheetName).dropna()
+        with span('baseline_read', self.path):
+            sheets = self._read_sheets([day_sheetName, night_sheetName])
+        day:DataFrame = sheets[day_sheetName].dropna()
+        night:DataFrame = sheets[night_sheetName].dropna()
         day.index.name = self.INDEX_NAME
         if not night.size:
-            return day.set_index(self.INDEX_NAME)
+            receivers = day.rename(columns={"Memoria":"Diurno"})
+            receivers['Diurno'] = zero_pad(receivers['Diurno'])
+            return receivers
         receivers = merge(day, 
                           night, 
                           left_index=True, 
                           right_index=True).rename(columns={"Memoria_x":"Diurno",
                                                             "Memoria_y":"Nocturno"})
-        receivers['Diurno'] = receivers['Diurno'].apply(lambda x: str(int(x)).zfill(4))
-        receivers['Nocturno'] = receivers['Nocturno'].apply(lambda x: str(int(x)).zfill(4))
+        receivers['Diurno'] = zero_pad(receivers['Diurno'])
+        receivers['Nocturno'] = zero_pad(receivers['Nocturno'])
         return receivers
     
     @property	
     def receivers(self):
         if not isinstance(self._receivers, DataFrame):
-            self._receivers = self._merge_data()
+            self._receivers = self._merge_data(self.measurement)
+            self._memory_index = self._build_memory_index(self._receivers)
             return self._receivers
         return self._receivers
-        
+
+    @staticmethod
+    def _build_memory_index(receivers:DataFrame)->Dict[str, Tuple[str, str]]:
+        # Row by row, so the first receiver of a repeated memory is kept,
+        # as a search over the table would find it
+        memories = receivers.stack()
+        return dict(zip(memories.values[::-1], memories.index[::-1]))
+
+    @property
+    def memory_index(self)->Dict[str, Tuple[str, str]]:
+        """
+        Returns:
+            _type_: Dictionary from memory number to (receiver, period).
+        """
+        if self._memory_index is None:
+            self.receivers
+        return self._memory_index
+
     @property
     def receivers_as_dict(self):
         return self.receivers['Diurno'].to_dict(), self.receivers['Nocturno'].to_dict()
 
     def find_receiver_from_fileNumber(self, fileNumber: int|str):
-        try:
-            idx = self.receivers.isin((fileNumber,))
-            return self.receivers[idx].dropna(axis=0, how='all').index.values[0]    
-        except IndexError:
-            return None
+        receiver, _ = self.memory_index.get(fileNumber, (None, None))
+        return receiver
+
+    def find_receivers(self, fileNumbers:Iterable[int|str])->DataFrame:
+        """
+        Find the receiver and the period of several file numbers at once.
+
+        Returns:
+            _type_: DataFrame indexed by file number with columns 'Receivers'
+            and 'Period'. Both are None for file numbers not in the baseline.
+        """
+        fileNumbers = list(fileNumbers)
+        found = [self.memory_index.get(fileNumber, (None, None)) for fileNumber in fileNumbers]
+        return DataFrame(found, 
+                         index=fileNumbers, 
+                         columns=[self.INDEX_NAME, 'Period'],
+                         dtype=object)
+
+def load_baseline(path,
+                  cache:Optional[MemoryCache]=None,
+                  receivers_col:Optional[str]=None,
+                  memories_col:Optional[str]=None,
+                  measurement:Literal['Vibration', 'Noise']='Vibration')->BaseLine:
+    """
+    BaseLine of a workbook with its receivers already read. With cache, the
+    BaseLine is shared by content, so every session that opens the same
+    workbook reuses it.
+    """
+    key = (file_digest(path), receivers_col, memories_col, measurement)
+    baseline = cache.get(key) if cache is not None else None
+    if baseline is None:
+        baseline = BaseLine(path, receivers_col, memories_col, measurement=measurement)
+        baseline.receivers
+        if cache is not None:
+            cache.put(key, baseline, file_size(path) + object_size(baseline.receivers))
+    return baseline
 
 class Receiver:
     def __init__(self,name:str):
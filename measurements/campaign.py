@@ -0,0 +1,215 @@
+"""
+Process a whole vibration campaign folder without the Streamlit page.
+
+Usage:
+    python -m measurements.campaign Vibrations/ --output summary.xlsx
+    python -m measurements.campaign Vibrations.zip --output summary.xlsx
+
+The summary is written to the output file and a JSON report with the time
+of each stage is printed to stdout. With --profile, the spans of every file
+are also logged to stderr as JSON lines.
+"""
+from argparse import ArgumentParser
+from json import dumps, loads
+from logging import INFO, basicConfig
+from os import cpu_count
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Optional
+from data.cache import ParquetCache
+from data.data_management import save_data
+from data.profiling import Profiler
+from documents.documents import BaseLine
+from measurements.parsers import RIONParser
+from measurements.frequency import get_frequency_summary
+from measurements.loaders import close_archives, find_files, unsupported_errors
+from measurements.events import Limits, add_events, detect_events, has_limits
+from measurements.ingestion import get_summaries
+from measurements.vibration import PERIODS, file_name, format_summary
+
+def find_baseline(files:List):
+    """
+    Returns:
+        _type_: The first workbook of files, paths or ZIP members.
+    """
+    workbooks = [file for file in files if file_name(file).endswith('.xlsx')]
+    return workbooks[0] if workbooks else None
+
+def file_path(file)->str:
+    return getattr(file, 'path', None) or str(file)
+
+def process_campaign(folder:str|Path,
+                     output:str|Path,
+                     baseline_path:Optional[str|Path]=None,
+                     workers:Optional[int]=None,
+                     chunksize:Optional[int]=None,
+                     replace_outliers:bool=False,
+                     cache_dir:Optional[str|Path]=None,
+                     parser:Optional[RIONParser]=None,
+                     profile:bool=False,
+                     track_memory:bool=False,
+                     details:bool=False,
+                     frequency:bool=False,
+                     limits:Optional[Dict[str, Limits]]=None)->Dict:
+    """
+    Compute the summary of every Inst file of a campaign and write it.
+
+    Args:
+        folder: Campaign folder or ZIP archive, searched recursively for
+            Inst files. Archives are read without extracting them.
+        output: Summary file, '.xlsx', '.csv' or '.parquet'.
+        baseline_path: Baseline workbook. The first '.xlsx' in folder is used
+            if not given, and receivers are left empty if there is none.
+        workers: Number of worker processes, by default the number of CPUs.
+            With 0 or 1 the files are read one after another in this process.
+        chunksize: Read the files in chunks of that many rows.
+        replace_outliers: Write the summary with outliers replaced by the median.
+        cache_dir: Folder of a ParquetCache of parsed files.
+        parser: RIONParser profile used to read the files.
+        profile: Record the spans of each file, they are logged and added to
+            the report by stage.
+        track_memory: Also record the peak memory of each span.
+        details: Also write the PPV values of every file, see save_data.
+        frequency: Add the peak band of each axis from the OCT Calc files.
+        limits: Limits by period. The events over them are written with the
+            summary, see save_data, and counted in the summary.
+
+    Returns:
+        _type_: Report with the number of files, the errors by file number and
+        the seconds spent in each stage.
+    """
+    if profile:
+        with Profiler(track_memory) as profiler:
+            report = process_campaign(folder, output, baseline_path, workers, chunksize,
+                                      replace_outliers, cache_dir, parser,
+                                      details=details, frequency=frequency, limits=limits)
+        profiler.log(run=str(folder))
+        report['profile'] = loads(profiler.summary().to_json(orient='index'))
+        return report
+    timings = {}
+    begin = perf_counter()
+    found = find_files(folder)
+    files = found['rion_inst']
+    baseline_path = baseline_path or find_baseline(found['other'])
+    timings['discover'] = perf_counter() - begin
+
+    begin = perf_counter()
+    baseline = None
+    if baseline_path is not None:
+        baseline = BaseLine(baseline_path)
+        baseline.receivers
+    timings['baseline'] = perf_counter() - begin
+
+    begin = perf_counter()
+    cache = ParquetCache(cache_dir) if cache_dir else None
+    if workers is None:
+        workers = cpu_count() or 1
+    summaries = get_summaries(files,
+                              baseline=baseline,
+                              # get_summaries reads the files in this process without workers
+                              workers=workers if workers > 1 else None,
+                              chunksize=chunksize,
+                              cache=cache,
+                              parser=parser)
+    timings['summary'] = perf_counter() - begin
+
+    begin = perf_counter()
+    summary = summaries.summary_non_outliers if replace_outliers else summaries.summary
+    summary = format_summary(summary, baseline)
+    timings['receivers'] = perf_counter() - begin
+
+    frequency_errors = {}
+    if frequency:
+        begin = perf_counter()
+        frequency_summary = get_frequency_summary(found['rion_calc'])
+        summary = summary.join(frequency_summary.statistics.summary())
+        frequency_errors = frequency_summary.errors
+        timings['frequency'] = perf_counter() - begin
+
+    begin = perf_counter()
+    for vibration in summaries.objects.values():
+        vibration.set_replace_outliers(replace_outliers)
+    events = None
+    if limits and has_limits(limits):
+        events = detect_events({file_number: vibration.data
+                                for file_number, vibration in summaries.objects.items()}, limits)
+        summary = add_events(summary, events)
+    timings['events'] = perf_counter() - begin
+
+    begin = perf_counter()
+    file_details = None
+    if details:
+        file_details = {file_number: vibration.data for file_number, vibration in summaries.objects.items()}
+    save_data(summary, output, details=file_details, events=events)
+    timings['write'] = perf_counter() - begin
+    close_archives(file for files_ in found.values() for file in files_)
+
+    total = sum(timings.values())
+    report = {'folder': str(folder),
+              'output': str(output),
+              'baseline': file_path(baseline_path) if baseline_path else None,
+              'files': len(files),
+              'processed': len(summaries.objects),
+              'errors': {**summaries.errors, **frequency_errors, **unsupported_errors(found)},
+              'events': None if events is None else len(events),
+              'seconds': timings,
+              'total_seconds': total,
+              'files_per_second': len(files) / total if total else None}
+    if cache:
+        report['cache'] = cache.stats
+    return report
+
+def period_limit(values:Optional[List[float]], index:int)->Optional[float]:
+    # One value is the limit of both periods
+    if not values:
+        return None
+    return values[min(index, len(values) - 1)]
+
+def main(argv:Optional[List[str]]=None)->int:
+    arguments = ArgumentParser(description='Process a RION vibration campaign folder.')
+    arguments.add_argument('folder', help='Campaign folder or ZIP archive with Auto_XXXX/Auto_Inst/*.rnd files')
+    arguments.add_argument('-o', '--output', default='Vibration_summary.xlsx',
+                           help='Summary file, .xlsx, .csv or .parquet')
+    arguments.add_argument('-b', '--baseline', help='Baseline workbook (.xlsx)')
+    arguments.add_argument('-w', '--workers', type=int, help='Worker processes, all CPUs by default. 0 or 1 reads the files in this process')
+    arguments.add_argument('--chunksize', type=int, help='Read files in chunks of this many rows')
+    arguments.add_argument('--replace-outliers', action='store_true',
+                           help='Replace outliers with the median before summarizing')
+    arguments.add_argument('--cache-dir', help='Folder to cache parsed files')
+    arguments.add_argument('--engine', choices=['c', 'pyarrow'], default='c',
+                           help='CSV reader used to parse the files')
+    arguments.add_argument('--profile', action='store_true',
+                           help='Log the time of each stage of each file to stderr')
+    arguments.add_argument('--track-memory', action='store_true',
+                           help='With --profile, also log the peak memory of each stage')
+    arguments.add_argument('--details', action='store_true',
+                           help='Also write the PPV values of every file')
+    arguments.add_argument('--frequency', action='store_true',
+                           help='Add the peak band of each axis from the OCT Calc files')
+    arguments.add_argument('--pvs-limit', type=float, nargs='+', metavar=('DIURNO', 'NOCTURNO'),
+                           help='PVS limit in m/s, a second value for Nocturno')
+    arguments.add_argument('--ppv-limit', type=float, nargs='+', metavar=('DIURNO', 'NOCTURNO'),
+                           help='PPV limit of each axis in m/s, a second value for Nocturno')
+    args = arguments.parse_args(argv)
+    limits = {period: Limits(pvs=period_limit(args.pvs_limit, index),
+                             ppv=period_limit(args.ppv_limit, index))
+              for index, period in enumerate(PERIODS)}
+    basicConfig(level=INFO, format='%(message)s')
+    report = process_campaign(args.folder,
+                              args.output,
+                              baseline_path=args.baseline,
+                              workers=args.workers,
+                              chunksize=args.chunksize,
+                              replace_outliers=args.replace_outliers,
+                              cache_dir=args.cache_dir,
+                              parser=RIONParser(engine=args.engine),
+                              profile=args.profile,
+                              track_memory=args.track_memory,
+                              details=args.details,
+                              frequency=args.frequency,
+                              limits=limits)
+    print(dumps(report, default=str))
+    return 0 if report['processed'] else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,135 @@
+"""
+Intervals where the PPV values of a campaign go over a limit.
+
+The PPV tables of all the files are concatenated and compared with the limit
+of the period of each fix at once. Consecutive fixes over a limit in the same
+file are one event, found from where the comparison changes, and the peak of
+every event is computed with reductions over the event boundaries.
+"""
+from typing import Dict, NamedTuple, Optional
+from numpy import arange, array, column_stack, errstate, flatnonzero, float64, fmax, full, inf, isnan, maximum, \
+    median, nan, ndarray, r_, repeat, unique, where
+from pandas import DataFrame, DatetimeIndex, Series, concat
+from data.profiling import span
+from measurements.vibration import PERIODS, is_day
+
+PPV_COLUMNS = ['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']
+EVENT_COLUMNS = ['File Number', 'Period', 'Start Time', 'End Time', 'Duration [s]', 'Fixes',
+                 'Peak Time', *PPV_COLUMNS, 'Exceeded']
+# Names of the columns over the limit, by bit mask of PPV_COLUMNS
+EXCEEDED_NAMES = array([', '.join(column for bit, column in enumerate(PPV_COLUMNS) if mask >> bit & 1)
+                        for mask in range(1 << len(PPV_COLUMNS))], dtype=object)
+
+class Limits(NamedTuple):
+    """ Limits of one period in m/s, None for no limit. """
+    pvs: Optional[float] = None
+    ppv: Optional[float] = None
+
+    def by_column(self)->list:
+        """
+        Returns:
+            _type_: Limit of each column of PPV_COLUMNS, NaN for no limit. The
+            PPV limit applies to each axis.
+        """
+        ppv = nan if self.ppv is None else self.ppv
+        return [ppv, ppv, ppv, nan if self.pvs is None else self.pvs]
+
+def has_limits(limits:Dict[str, Limits])->bool:
+    return any(limit is not None for limits_ in limits.values() for limit in limits_)
+
+def _seconds(deltas)->ndarray:
+    return deltas.astype('timedelta64[ns]').astype(float64) / 1e9
+
+def _segments(values, starts, ends, ufunc):
+    # ufunc of the rows from each start to its end, both included. A padding
+    # row lets the reduction stop after the last row
+    padded = r_[values, full((1,) + values.shape[1:], -inf)]
+    indices = column_stack((starts, ends + 1)).ravel()
+    return ufunc.reduceat(padded, indices, axis=0)[::2]
+
+def detect_events(ppvs:Dict[str, DataFrame], limits:Dict[str, Limits])->DataFrame:
+    """
+    Find every interval where PVS or any axis PPV is over the limit of its
+    period, in one pass over the fixes of all the files.
+
+    Args:
+        ppvs: PPV tables by file number, with 'Start Time' and PPV_COLUMNS.
+        limits: Limits by period, 'Diurno' and 'Nocturno'. The period of each
+            fix follows Vibrations.period.
+
+    Returns:
+        _type_: Table of events with EVENT_COLUMNS, by file and time. The
+        PPV columns have the peak of each event, 'Peak Time' the fix of the
+        highest PVS and 'Exceeded' the columns that went over their limit.
+        The duration counts the last fix as long as the median fix of its file.
+    """
+    file_numbers = [file_number for file_number, table in ppvs.items() if len(table)]
+    if not file_numbers:
+        return DataFrame(columns=EVENT_COLUMNS).rename_axis('Event')
+    with span('events'):
+        data = concat([ppvs[file_number][['Start Time', *PPV_COLUMNS]] for file_number in file_numbers],
+                      ignore_index=True)
+        files = repeat(arange(len(file_numbers)), [len(ppvs[file_number]) for file_number in file_numbers])
+        times = data['Start Time'].to_numpy()
+        values = data[PPV_COLUMNS].to_numpy(float64)
+        day = is_day(DatetimeIndex(times).hour.to_numpy())
+        day_limits, night_limits = (array(limits.get(period, Limits()).by_column()) for period in PERIODS)
+        with errstate(invalid='ignore'):
+            over = values > where(day[:, None], day_limits, night_limits)
+        exceeded = over.any(axis=1)
+        first = r_[True, files[1:] != files[:-1]]
+        last = r_[first[1:], True]
+        starts = flatnonzero(exceeded & (first | ~r_[False, exceeded[:-1]]))
+        ends = flatnonzero(exceeded & (last | ~r_[exceeded[1:], False]))
+
+        # NaN values are skipped, a column with only NaN values has a NaN peak
+        peaks = _segments(values, starts, ends, fmax)
+        # Peak time: first fix of each event where the PVS is its peak. Every
+        # fix over a limit is in one event, and the events are in order. With
+        # NaN as -inf every event has a peak fix, its first one if all are NaN
+        rows = flatnonzero(exceeded)
+        event = repeat(arange(len(starts)), ends - starts + 1)
+        pvs = values[:, 3]
+        at_peak = where(isnan(pvs), -inf, pvs)[rows] == where(isnan(peaks[:, 3]), -inf, peaks[:, 3])[event]
+        _, first_peak = unique(event[at_peak], return_index=True)
+        peak_times = times[rows[at_peak][first_peak]]
+
+        # Median time between fixes of each file, the length of the last fix of an event
+        same_file = ~first[1:]
+        steps = Series(_seconds(times[1:] - times[:-1])[same_file]).groupby(files[1:][same_file]).median()
+        default_step = median(steps) if len(steps) else 0.0
+        step = steps.reindex(range(len(file_numbers))).fillna(default_step).to_numpy()
+        duration = _seconds(times[ends] - times[starts]) + step[files[ends]]
+
+        over_columns = _segments(over.astype('int64'), starts, ends, maximum) > 0
+    events = DataFrame({'File Number': array(file_numbers, dtype=object)[files[starts]],
+                        'Period': where(day[starts], PERIODS[0], PERIODS[1]),
+                        'Start Time': times[starts],
+                        'End Time': times[ends],
+                        'Duration [s]': duration,
+                        'Fixes': ends - starts + 1,
+                        'Peak Time': peak_times},
+                       index=arange(1, len(starts) + 1))
+    for index, column in enumerate(PPV_COLUMNS):
+        events[column] = peaks[:, index]
+    events['Exceeded'] = EXCEEDED_NAMES[over_columns @ (1 << arange(len(PPV_COLUMNS)))]
+    return events.rename_axis('Event')
+
+def event_summary(events:DataFrame)->DataFrame:
+    """
+    Returns:
+        _type_: Number of events and seconds over the limits by file number.
+    """
+    grouped = events.groupby('File Number')
+    return DataFrame({'Events': grouped.size(),
+                      'Time Over Limit [s]': grouped['Duration [s]'].sum()})
+
+def add_events(summary:DataFrame, events:DataFrame)->DataFrame:
+    """
+    Returns:
+        _type_: summary with the columns of event_summary, 0 for files
+        without events.
+    """
+    counts = event_summary(events).reindex(summary.index, fill_value=0)
+    counts['Events'] = counts['Events'].astype('int64')
+    return summary.join(counts)
@@ -0,0 +1,190 @@
+"""
+Octave band analysis of RION OCT Calc files.
+
+Calc files have a header line, then one row per record with 'Start Time' and
+one column per axis and band. Band columns are recognised by their name: the
+axis ('X', 'Y' or 'Z') at the start and the centre frequency before 'Hz' at
+the end, e.g. 'X_31.5Hz' or 'Z Lv 1kHz'. Other columns are ignored.
+
+Each file is kept as one array of shape (records, axes, bands), and the band
+statistics of all files are computed together over the concatenated records.
+"""
+from re import IGNORECASE, compile
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from numpy import add, arange, concatenate, cumsum, errstate, fmax, full, isnan, log10, nan, ndarray, \
+    r_, searchsorted, take_along_axis, unique, where
+from pandas import DataFrame, MultiIndex, read_csv
+from data.profiling import span
+from measurements.parsers import RIONParser, sniff_timestamp_format
+from measurements.vibration import file_name, get_file_number
+
+AXES = ('X', 'Y', 'Z')
+BAND_PATTERN = compile(r'^(?P<axis>[XYZ])[_ ].*?(?P<frequency>\d+(?:\.\d+)?)\s*(?P<kilo>k?)Hz\)?$',
+                       IGNORECASE)
+
+def is_calc_file(file)->bool:
+    return 'Calc' in file_name(file).split('_')
+
+def parse_band_column(column:str)->Optional[Tuple[str, float]]:
+    """
+    Returns:
+        _type_: Axis and centre frequency in Hz of a band column, or None if
+        column is not a band column.
+    """
+    match = BAND_PATTERN.match(column.strip())
+    if match is None:
+        return None
+    frequency = float(match['frequency']) * (1000 if match['kilo'] else 1)
+    return match['axis'].upper(), frequency
+
+class OctaveSpectrum(NamedTuple):
+    """ Band values of one Calc file. """
+    file_number: str
+    times: ndarray
+    frequencies: ndarray
+    values: ndarray
+    decibels: bool
+
+def read_octave(file, float32:bool=True)->OctaveSpectrum:
+    """
+    Read a RION OCT Calc file into an array of shape (records, axes, bands),
+    with NaN for the bands an axis does not have.
+
+    Args:
+        file: Path or file object of the Calc file.
+        float32: Keep the values as float32 to halve their memory.
+    """
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    columns = {}
+    def use_column(column:str)->bool:
+        band = parse_band_column(column)
+        if band is not None:
+            columns[column] = band
+        return column == 'Start Time' or band is not None
+    with span('read_csv', file):
+        data = read_csv(file, skiprows=1, usecols=use_column)
+    if not columns:
+        raise ValueError('No band columns found in file')
+    frequencies = unique([frequency for _, frequency in columns.values()])
+    names = list(columns)
+    axes = [AXES.index(columns[name][0]) for name in names]
+    bands = searchsorted(frequencies, [columns[name][1] for name in names])
+    values = full((len(data), len(AXES)*len(frequencies)), nan, dtype='float32' if float32 else 'float64')
+    values[:, [axis*len(frequencies) + band for axis, band in zip(axes, bands)]] = data[names].to_numpy()
+    times = data['Start Time']
+    times = RIONParser().parse_timestamps(times, sniff_timestamp_format(times.iloc[0]) if len(times) else None)
+    return OctaveSpectrum(get_file_number(file_name(file)),
+                          times.to_numpy(),
+                          frequencies,
+                          values.reshape(len(data), len(AXES), len(frequencies)),
+                          any('db' in name.lower() for name in names))
+
+def _align(spectrum:OctaveSpectrum, frequencies:ndarray)->ndarray:
+    # Bands of files measured with another setup are placed on the common grid
+    if len(spectrum.frequencies) == len(frequencies) and (spectrum.frequencies == frequencies).all():
+        return spectrum.values
+    values = full(spectrum.values.shape[:2] + (len(frequencies),), nan, dtype=spectrum.values.dtype)
+    values[:, :, searchsorted(frequencies, spectrum.frequencies)] = spectrum.values
+    return values
+
+def _as_float64(values:ndarray)->ndarray:
+    # Through the shortest text of each float32, so 81.8 is not shown as 81.80000305
+    if values.dtype == 'float32':
+        return values.astype(str).astype('float64')
+    return values
+
+class BandStatistics(NamedTuple):
+    """
+    Band statistics of several files, arrays of shape (files, axes, bands).
+    'mean' is the energy average when the values are levels in dB.
+    """
+    file_numbers: List[str]
+    frequencies: ndarray
+    maxima: ndarray
+    mean: ndarray
+
+    def table(self, statistic:str='maxima')->DataFrame:
+        """
+        Returns:
+            _type_: Table indexed by file number with (axis, frequency) columns.
+        """
+        values = _as_float64(getattr(self, statistic))
+        return DataFrame(values.reshape(len(values), -1),
+                         index=self.file_numbers,
+                         columns=MultiIndex.from_product([AXES, self.frequencies],
+                                                         names=['Axis', 'Frequency [Hz]']))
+
+    def summary(self)->DataFrame:
+        """
+        Returns:
+            _type_: Band with the highest maximum of each axis and its value,
+            in columns '<axis>_Peak_Hz' and '<axis>_Peak_Level', by file number.
+        """
+        maxima = where(isnan(self.maxima), -float('inf'), self.maxima)
+        peaks = maxima.argmax(axis=2)
+        levels = _as_float64(take_along_axis(self.maxima, peaks[:, :, None], axis=2)[:, :, 0])
+        summary = {}
+        for index, axis in enumerate(AXES):
+            summary[f'{axis}_Peak_Hz'] = where(isnan(levels[:, index]), nan, self.frequencies[peaks[:, index]])
+            summary[f'{axis}_Peak_Level'] = levels[:, index]
+        return DataFrame(summary, index=self.file_numbers)
+
+def band_statistics(spectra:Iterable[OctaveSpectrum])->BandStatistics:
+    """
+    Maximum and mean of every band of every file in one pass over the records
+    of all the files, with reductions over the file boundaries.
+    """
+    spectra = [spectrum for spectrum in spectra if len(spectrum.values)]
+    if not spectra:
+        return BandStatistics([], arange(0.0), full((0, len(AXES), 0), nan), full((0, len(AXES), 0), nan))
+    frequencies = unique(concatenate([spectrum.frequencies for spectrum in spectra]))
+    decibels = any(spectrum.decibels for spectrum in spectra)
+    values = concatenate([_align(spectrum, frequencies) for spectrum in spectra])
+    starts = r_[0, cumsum([len(spectrum.values) for spectrum in spectra])[:-1]]
+    missing = isnan(values)
+    with errstate(invalid='ignore', divide='ignore'):
+        maxima = fmax.reduceat(values, starts, axis=0)
+        energy = 10**(values/10) if decibels else values
+        totals = add.reduceat(where(missing, 0, energy), starts, axis=0, dtype='float64')
+        counts = add.reduceat(~missing, starts, axis=0, dtype='int64')
+        mean = totals / counts
+        if decibels:
+            mean = 10*log10(mean)
+    return BandStatistics([spectrum.file_number for spectrum in spectra], frequencies, maxima, mean)
+
+class FrequencySummary(NamedTuple):
+    statistics: BandStatistics
+    spectra: Dict[str, OctaveSpectrum]
+    errors: Dict[str, str]
+
+def get_frequency_summary(files:Iterable, float32:bool=True)->FrequencySummary:
+    """
+    Read every OCT Calc file and compute the band statistics of all of them.
+
+    Args:
+        files: Uploaded files or paths. Files that are not 'Calc' files are skipped.
+        float32: See read_octave.
+
+    Returns:
+        _type_: FrequencySummary with the BandStatistics, the spectra by file
+        number and the errors by file name.
+    """
+    spectra:Dict[str, OctaveSpectrum] = {}
+    errors:Dict[str, str] = {}
+    for file in files:
+        if not is_calc_file(file):
+            continue
+        try:
+            spectrum = read_octave(file, float32)
+        except Exception as error:
+            errors[file_name(file)] = f'{type(error).__name__}: {error}'
+            continue
+        if not len(spectrum.values):
+            errors[file_name(file)] = 'ValueError: The file has no measurements'
+            continue
+        spectra[spectrum.file_number] = spectrum
+    spectra = dict(sorted(spectra.items()))
+    with span('bands'):
+        statistics = band_statistics(spectra.values())
+    return FrequencySummary(statistics, spectra, errors)
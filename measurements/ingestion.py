@@ -0,0 +1,538 @@
+"""
+Processing of RION Inst files in worker processes.
+
+Files are reduced to their PPV tables in a pool of processes, in the
+background when called from the app. VibrationAnalysis keeps the results of
+an upload by file, so only new or changed files are processed again.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
+from multiprocessing import get_all_start_methods, get_context
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+from pandas import DataFrame, concat
+from data.cache import MemoryCache, ParquetCache, file_digest, file_size
+from data.profiling import Profiler, active_profiler, span
+from data.store import MeasurementStore
+from documents.documents import BaseLine
+from measurements.loaders import open_measurement
+from measurements.parsers import RIONParser
+from measurements.vibration import RIONVibrations, VibrationSummary, _result_key, build_summary, file_identity, \
+    file_name, get_file_number, get_max_pvs_row
+
+#How often pending files check for a cancellation while waiting for results
+CANCEL_POLL_SECONDS = 0.2
+#Workers are started from a clean server process, forking the threads of the app is unsafe
+START_METHOD = 'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn'
+
+class FileResult(NamedTuple):
+    """ Compact result of processing one file in a worker process. """
+    name: str
+    file_number: Optional[str]
+    ppvs: Optional[DataFrame]
+    error: Optional[str]
+    spans: Optional[List[dict]] = None
+
+def _file_source(file):
+    """
+    Returns what a worker needs to read the file: the path of files on disk,
+    or the bytes of uploaded files.
+    """
+    if isinstance(file, (str, Path)):
+        return str(file)
+    if hasattr(file, 'getvalue'):
+        return file.getvalue()
+    file.seek(0)
+    return file.read()
+
+def process_file(name:str,
+                 source:bytes|str,
+                 chunksize:Optional[int]=None,
+                 parser:Optional[RIONParser]=None,
+                 profile:bool=False,
+                 track_memory:bool=False)->FileResult:
+    """
+    Parse one RION Inst file and reduce it to its PPV table. Errors are
+    returned in the result instead of being raised. With profile, the spans
+    recorded while processing the file are returned in the result.
+    """
+    if profile:
+        with Profiler(track_memory) as profiler:
+            result = process_file(name, source, chunksize, parser)
+        return result._replace(spans=profiler.spans)
+    try:
+        file_number = get_file_number(name)
+    except AttributeError:
+        return FileResult(name, None, None, 'File number not found in file name')
+    try:
+        if isinstance(source, bytes):
+            file_path = BytesIO(source)
+            file_path.name = name
+        else:
+            file_path = Path(source)
+        ppvs = open_measurement(file_path, chunksize=chunksize, parser=parser).ppvs
+    except Exception as error:
+        return FileResult(name, file_number, None, f'{type(error).__name__}: {error}')
+    return FileResult(name, file_number, ppvs, None)
+
+def iter_results(files:Iterable,
+                 workers:Optional[int]=None,
+                 chunksize:Optional[int]=None,
+                 cache:Optional[ParquetCache]=None,
+                 parser:Optional[RIONParser]=None,
+                 profile:bool=False,
+                 track_memory:bool=False,
+                 cancel:Optional[Event]=None)->Iterator[FileResult]:
+    """
+    Process files in a pool of worker processes and yield the result of each
+    file as soon as it is ready, files found in cache first. Only the PPV
+    table of each file is sent back to this process.
+
+    Args:
+        files: Uploaded files or paths of RION Inst files.
+        workers: Number of worker processes, by default the number of CPUs.
+        chunksize: If given, workers read the files in chunks of that many rows.
+        cache: ParquetCache checked before sending a file to the workers. The
+            PPV tables computed by the workers are stored in it.
+        parser: RIONParser profile used by the workers.
+        profile, track_memory: Record the spans of each file, see process_file.
+        cancel: When set, files not started yet are cancelled and no more
+            results are yielded.
+    """
+    parser = parser or RIONParser()
+    jobs = []
+    for file in files:
+        if cancel and cancel.is_set():
+            return
+        name = file_name(file)
+        key = None
+        if cache:
+            key = file_digest(file, parser.version)
+            ppvs = cache.get(key, 'ppvs', file_size(file))
+            if ppvs is not None:
+                yield FileResult(name, _result_key(name), ppvs, None)
+                continue
+        jobs.append((name, key, _file_source(file)))
+    if not jobs:
+        return
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context(START_METHOD))
+    try:
+        futures = {executor.submit(process_file, name, source, chunksize, parser,
+                                   profile, track_memory): (name, key)
+                   for name, key, source in jobs}
+        pending = set(futures)
+        while pending and not (cancel and cancel.is_set()):
+            finished, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, key = futures[future]
+                try:
+                    result = future.result()
+                except Exception as error:
+                    result = FileResult(name, None, None, f'{type(error).__name__}: {error}')
+                if cache and result.error is None:
+                    cache.put(key, 'ppvs', result.ppvs)
+                yield result
+    finally:
+        # Files already started finish in the background, the rest are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def ingest_files(files:Iterable,
+                 workers:Optional[int]=None,
+                 chunksize:Optional[int]=None,
+                 cache:Optional[ParquetCache]=None,
+                 parser:Optional[RIONParser]=None)->List[FileResult]:
+    """
+    Process files in a pool of worker processes, see iter_results.
+
+    Returns:
+        _type_: List of FileResult sorted by file number and file name.
+    """
+    profiler = active_profiler()
+    results = []
+    for result in iter_results(files, workers, chunksize, cache, parser,
+                               profile=profiler is not None,
+                               track_memory=profiler is not None and profiler.track_memory):
+        if profiler is not None and result.spans:
+            profiler.extend(result.spans)
+        results.append(result)
+    return sorted(results, key=lambda result: (result.file_number or '', result.name))
+
+def get_summaries(files:Iterable,
+                  baseline:Optional[BaseLine]=None,
+                  workers:Optional[int]=None,
+                  chunksize:Optional[int]=None,
+                  cache:Optional[ParquetCache]=None,
+                  parser:Optional[RIONParser]=None,
+                  store:Optional[MeasurementStore]=None)->VibrationSummary:
+    """
+    Read every vibration measurement once and build both summary tables.
+
+    Args:
+        files: Uploaded files or paths, e.g. the 'rion_inst' files of
+            measurements.loaders.classify. Each file is read by the Vibrations
+            class of its format, files of other formats are listed in errors.
+        baseline: BaseLine used to find the receiver of each file.
+        workers: If given, files are processed in that many worker processes
+            and the objects only hold the PPV values, not the raw data.
+        chunksize: If given, files are read in chunks of that many rows to
+            bound the memory used by long recordings.
+        cache: ParquetCache used to skip parsing files that were already processed.
+        parser: RIONParser profile used to read the files.
+        store: MeasurementStore given to the objects, see RIONVibrations.
+
+    Returns:
+        _type_: VibrationSummary with the raw summary, the summary with outliers
+        replaced by the median, the RIONVibrations objects by file number and
+        the errors by file number (or file name when it has no number).
+    """
+    files = list(files)
+    objects:Dict[str, RIONVibrations] = {}
+    errors:Dict[str, str] = {}
+    if workers is None:
+        for file in files:
+            if hasattr(file, 'seek'):
+                file.seek(0)
+            try:
+                rion_file = open_measurement(file,
+                                             baseline=baseline,
+                                             chunksize=chunksize,
+                                             cache=cache,
+                                             parser=parser,
+                                             store=store)
+                objects[rion_file.file_number] = rion_file
+            except Exception as error:
+                errors[_result_key(file_name(file))] = f'{type(error).__name__}: {error}'
+    else:
+        with span('ingest'):
+            results = ingest_files(files, workers, chunksize, cache, parser)
+        return summarize_results(results, baseline, store)
+    return summarize(objects, errors)
+
+def summarize_results(results:Iterable[FileResult],
+                      baseline:Optional[BaseLine]=None,
+                      store:Optional[MeasurementStore]=None)->VibrationSummary:
+    """
+    Build the summaries of the results of worker processes, see get_summaries.
+    """
+    objects:Dict[str, RIONVibrations] = {}
+    errors:Dict[str, str] = {}
+    for result in results:
+        if result.error:
+            errors[_result_key(result.name)] = result.error
+            continue
+        objects[result.file_number] = RIONVibrations.from_ppvs(result.name, result.ppvs, baseline, store)
+    return summarize(objects, errors)
+
+def summarize(objects:Dict[str, RIONVibrations], errors:Dict[str, str])->VibrationSummary:
+    """
+    Build both summary tables from the processed files. Files with no
+    measurements are moved to errors.
+    """
+    for file_number in [file_number for file_number, rion_file in objects.items()
+                        if rion_file.ppvs.empty]:
+        del objects[file_number]
+        errors[file_number] = 'ValueError: The file has no measurements'
+    rows = {file_number: get_max_pvs_row(rion_file.ppvs)
+            for file_number, rion_file in objects.items()}
+    non_outliers_rows = {file_number: get_max_pvs_row(rion_file._outliers_to_median)
+                         for file_number, rion_file in objects.items()}
+    return VibrationSummary(build_summary(rows),
+                            build_summary(non_outliers_rows),
+                            objects,
+                            errors)
+
+class FileChanges(NamedTuple):
+    added: List[str]
+    changed: List[str]
+    removed: List[str]
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+def _merge_rows(summary:DataFrame, rows:DataFrame)->DataFrame:
+    if rows.empty:
+        return summary
+    if summary.empty:
+        return rows.sort_index()
+    return concat([summary.drop(rows.index, errors='ignore'), rows]).sort_index()
+
+class BackgroundIngestion:
+    """
+    Runs iter_results in a thread, so the caller keeps responding while the
+    files are processed and takes the result of each file as it finishes.
+
+    Args:
+        files: Uploaded files or paths of RION Inst files.
+        workers, chunksize, cache, parser, profile, track_memory: See iter_results.
+    """
+    def __init__(self,
+                 files:List,
+                 workers:Optional[int]=None,
+                 chunksize:Optional[int]=None,
+                 cache:Optional[ParquetCache]=None,
+                 parser:Optional[RIONParser]=None,
+                 profile:bool=False,
+                 track_memory:bool=False):
+        self.names = [file_name(file) for file in files]
+        self.processed:List[str] = []
+        self.error:Optional[str] = None
+        self._results:List[FileResult] = []
+        self._lock = Lock()
+        self._cancel = Event()
+        self._thread = Thread(target=self._run,
+                              args=(files, workers, chunksize, cache, parser, profile, track_memory),
+                              daemon=True)
+        self._thread.start()
+
+    @property
+    def total(self)->int:
+        return len(self.names)
+
+    @property
+    def done(self)->int:
+        return len(self.processed)
+
+    @property
+    def running(self)->bool:
+        return self._thread.is_alive()
+
+    @property
+    def cancelled(self)->bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """ Drop the files not started yet, the ones in progress still finish. """
+        self._cancel.set()
+
+    def join(self, timeout:Optional[float]=None):
+        self._thread.join(timeout)
+
+    def _run(self, *args):
+        try:
+            for result in iter_results(*args, cancel=self._cancel):
+                with self._lock:
+                    self._results.append(result)
+                    self.processed.append(result.name)
+        except Exception as error:
+            self.error = f'{type(error).__name__}: {error}'
+
+    def collect(self)->List[FileResult]:
+        """ Results finished since the last call. """
+        with self._lock:
+            results, self._results = self._results, []
+        return results
+
+class VibrationAnalysis:
+    """
+    Results of a set of RION Inst files kept by file name, so when files are
+    added to or removed from an upload only those files are processed and
+    the summaries are updated instead of rebuilt.
+
+    A file is processed again only if its identity (see file_identity) and
+    its content hash both change, a file uploaded again with the same
+    content keeps its results.
+
+    With update(background=True) the files are processed by a
+    BackgroundIngestion and their rows are added by collect() as they finish.
+    """
+    def __init__(self,
+                 workers:Optional[int]=None,
+                 chunksize:Optional[int]=None,
+                 cache:Optional[ParquetCache]=None,
+                 parser:Optional[RIONParser]=None,
+                 store:Optional[MeasurementStore]=None,
+                 shared:Optional[MemoryCache]=None):
+        """
+        Args:
+            workers, chunksize, cache, parser, store: See get_summaries.
+            shared: MemoryCache of PPV tables by content hash, shared with
+                other analyses so a file is only processed once per process.
+        """
+        self.workers = workers
+        self.chunksize = chunksize
+        self.cache = cache
+        self.parser = parser or RIONParser()
+        self.store = store
+        self.shared = shared
+        self.baseline:Optional[BaseLine] = None
+        self.objects:Dict[str, RIONVibrations] = {}
+        self.errors:Dict[str, str] = {}
+        self.summary = build_summary({})
+        self.summary_non_outliers = build_summary({})
+        # Spans recorded by the workers in the last background update
+        self.spans:List[dict] = []
+        # identity and content hash by file name
+        self._files:Dict[str, tuple] = {}
+        # Background jobs with the content hash of each of their files
+        self._jobs:List[tuple] = []
+
+    def set_baseline(self, baseline:Optional[BaseLine]):
+        self.baseline = baseline
+        for rion_file in self.objects.values():
+            rion_file.baseline = baseline
+
+    @property
+    def running(self)->bool:
+        """ True while background jobs have results not collected yet. """
+        return bool(self._jobs)
+
+    @property
+    def progress(self)->tuple:
+        """
+        Returns:
+            _type_: Files processed and files submitted by the background jobs
+            not collected yet.
+        """
+        return (sum(job.done for job, _ in self._jobs),
+                sum(job.total for job, _ in self._jobs))
+
+    def cancel(self):
+        for job, _ in self._jobs:
+            job.cancel()
+
+    def update(self,
+               files:Iterable,
+               baseline:Optional[BaseLine]=None,
+               background:bool=False,
+               profile:bool=False,
+               track_memory:bool=False)->FileChanges:
+        """
+        Process the files that are new or whose content changed since the last
+        update, and drop the results of the files that are no longer in files.
+
+        Args:
+            files: Uploaded files or paths, see get_summaries.
+            baseline: BaseLine used to find the receiver of each file.
+            background: Return at once and process the files in a
+                BackgroundIngestion, their results are added by collect().
+                Files of a running job are not submitted again.
+            profile, track_memory: Record the spans of each file in spans,
+                only with background.
+
+        Returns:
+            _type_: Names of the files added, changed and removed.
+        """
+        self.set_baseline(baseline)
+        inst_files = {file_name(file): file for file in files}
+        removed = [name for name in self._files if name not in inst_files]
+        added, changed, pending = [], [], []
+        seen = {}
+        for name, file in inst_files.items():
+            identity = file_identity(file)
+            previous = self._files.get(name)
+            if previous is not None and previous[0] == identity:
+                continue
+            digest = file_digest(file, self.parser.version)
+            seen[name] = (identity, digest)
+            if previous is not None and previous[1] == digest:
+                continue
+            (changed if previous is not None else added).append(name)
+            pending.append(file)
+        shared, pending = self._shared_results(pending, seen)
+        if pending and not background:
+            summaries = get_summaries(pending,
+                                      baseline=self.baseline,
+                                      workers=self.workers,
+                                      chunksize=self.chunksize,
+                                      cache=self.cache,
+                                      parser=self.parser,
+                                      store=self.store)
+        # Results change only once the new files were processed
+        for name in removed:
+            del self._files[name]
+        # Added files can have the error of a cancelled job
+        for name in removed + changed + added:
+            self._drop(_result_key(name))
+        self._files.update(seen)
+        if shared:
+            self._add(summarize_results(shared, self.baseline, self.store))
+        if pending and background:
+            if not self._jobs:
+                self.spans = []
+            job = BackgroundIngestion(pending, self.workers, self.chunksize, self.cache,
+                                      self.parser, profile, track_memory)
+            self._jobs.append((job, {name: seen[name][1] for name in job.names}))
+        elif pending:
+            for file in pending:
+                rion_file = summaries.objects.get(_result_key(file_name(file)))
+                if rion_file is not None:
+                    self._share(seen[file_name(file)][1], rion_file.ppvs)
+            self._add(summaries)
+        return FileChanges(added, changed, removed)
+
+    def _shared_results(self, files:List, seen:Dict[str, tuple])->tuple:
+        """
+        Returns:
+            _type_: Results found in the shared cache, and the files that
+            still have to be processed.
+        """
+        if self.shared is None:
+            return [], files
+        results, pending = [], []
+        for file in files:
+            name = file_name(file)
+            ppvs = self.shared.get(seen[name][1])
+            if ppvs is None:
+                pending.append(file)
+            else:
+                results.append(FileResult(name, _result_key(name), ppvs, None))
+        return results, pending
+
+    def _share(self, digest:str, ppvs:DataFrame):
+        if self.shared is not None:
+            self.shared.put(digest, ppvs)
+
+    def collect(self)->int:
+        """
+        Add the results finished by the background jobs since the last call.
+        Files of a finished job that were cancelled or failed are added to
+        errors and forgotten, so the next update submits them again. Results
+        of files removed or changed meanwhile are dropped.
+
+        Returns:
+            _type_: Number of results added.
+        """
+        results = []
+        missing = {}
+        jobs = []
+        for job, digests in self._jobs:
+            running = job.running
+            for result in job.collect():
+                if self._is_current(result.name, digests):
+                    results.append(result)
+                    self.spans.extend(result.spans or [])
+                    if result.error is None:
+                        self._share(digests[result.name], result.ppvs)
+            if running:
+                jobs.append((job, digests))
+                continue
+            reason = 'Cancelled' if job.cancelled else job.error or 'Not processed'
+            for name in digests:
+                if name not in job.processed and self._is_current(name, digests):
+                    missing[_result_key(name)] = reason
+                    del self._files[name]
+        self._jobs = jobs
+        if results or missing:
+            summaries = summarize_results(results, self.baseline, self.store)
+            summaries.errors.update(missing)
+            self._add(summaries)
+        return len(results)
+
+    def _is_current(self, name:str, digests:Dict[str, str])->bool:
+        return name in self._files and self._files[name][1] == digests[name]
+
+    def _drop(self, key:str):
+        rion_file = self.objects.pop(key, None)
+        if rion_file is not None:
+            rion_file.release()
+        self.errors.pop(key, None)
+        self.summary = self.summary.drop(key, errors='ignore')
+        self.summary_non_outliers = self.summary_non_outliers.drop(key, errors='ignore')
+
+    def _add(self, summaries:VibrationSummary):
+        self.objects = dict(sorted({**self.objects, **summaries.objects}.items()))
+        self.errors.update(summaries.errors)
+        self.summary = _merge_rows(self.summary, summaries.summary)
+        self.summary_non_outliers = _merge_rows(self.summary_non_outliers,
+                                                summaries.summary_non_outliers)
@@ -0,0 +1,317 @@
+"""
+Registry of measurement file formats.
+
+Each format is recognised from the first HEADER_BYTES of a file: RION files
+have a title line and then the column names, so the columns tell an Inst file
+from a Calc file or a sound level meter log. Files of other formats are never
+parsed.
+
+ZIP archives are read member by member straight from the archive, so
+campaigns can be uploaded or processed without extracting them.
+"""
+from io import SEEK_SET, BufferedIOBase, BytesIO
+from pathlib import Path, PurePosixPath
+from threading import Lock
+from typing import Callable, Dict, Iterable, Iterator, List, Literal, NamedTuple, Optional, Type
+from weakref import WeakSet
+from zipfile import ZipFile, ZipInfo
+from data.profiling import span
+from measurements.frequency import is_calc_file, parse_band_column
+from measurements.noise import LEVEL_COLUMNS
+from measurements.parsers import RIONParser
+from measurements.vibration import RIONVibrations, Vibrations, file_name, is_inst_file
+
+# Enough for the title line and the column names of every format
+HEADER_BYTES = 4096
+# Files that can be measurements or baselines, anything else is skipped without reading it
+MEASUREMENT_SUFFIXES = ('.rnd', '.csv', '.txt')
+MEMBER_SUFFIXES = MEASUREMENT_SUFFIXES + ('.xlsx',)
+
+class ZipArchive:
+    """
+    A ZIP archive shared by its members.
+
+    The directory of the archive is read once when it is opened, and every
+    member reads from the same open archive. close() closes the archive and
+    the streams of its members, reading a member afterwards opens the
+    archive again, once for all of them.
+    """
+    def __init__(self, source):
+        """
+        Args:
+            source: Path or file object of the archive.
+        """
+        self.source = source
+        self.name = file_name(source)
+        self._zip:Optional[ZipFile] = None
+        self._members:WeakSet = WeakSet()
+        self._lock = Lock()
+
+    def zip_file(self)->ZipFile:
+        with self._lock:
+            if self._zip is None:
+                if hasattr(self.source, 'getvalue'):
+                    # A position of its own in an uploaded archive, getvalue does not copy it
+                    self._zip = ZipFile(BytesIO(self.source.getvalue()))
+                else:
+                    self._zip = ZipFile(self.source)
+            return self._zip
+
+    def open(self, member:'ZipMember'):
+        self._members.add(member)
+        return self.zip_file().open(member.info)
+
+    def close(self):
+        for member in list(self._members):
+            member.release()
+        with self._lock:
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+
+class ZipMember(BufferedIOBase):
+    """
+    Read-only file object of a member of a ZIP archive.
+
+    The member is decompressed while it is read, so only the blocks being
+    read are in memory. Its stream stays open until release() or close(),
+    rewinding it does not open the member again.
+    """
+    def __init__(self, archive:ZipArchive, info:ZipInfo):
+        super().__init__()
+        self.archive = archive
+        self.info = info
+        self.name = PurePosixPath(info.filename).name
+        self.path = f'{archive.name}/{info.filename}'
+        self.size = info.file_size
+        # Identifies the content for file_identity, as the upload id does
+        self.file_id = (archive.name, info.filename, info.CRC)
+        self._stream = None
+
+    def __repr__(self)->str:
+        return f'ZipMember({self.path!r})'
+
+    def _open(self):
+        if self._stream is None:
+            self._stream = self.archive.open(self)
+        return self._stream
+
+    def readable(self)->bool:
+        return True
+
+    def seekable(self)->bool:
+        return True
+
+    def read(self, size:Optional[int]=-1)->bytes:
+        return self._open().read(-1 if size is None else size)
+
+    def read1(self, size:int=-1)->bytes:
+        return self._open().read1(size)
+
+    def readline(self, size:Optional[int]=-1)->bytes:
+        return self._open().readline(-1 if size is None else size)
+
+    def seek(self, offset:int, whence:int=SEEK_SET)->int:
+        if self._stream is None and offset == 0 and whence == SEEK_SET:
+            return 0
+        return self._open().seek(offset, whence)
+
+    def tell(self)->int:
+        return 0 if self._stream is None else self._stream.tell()
+
+    def getvalue(self)->bytes:
+        """ Content of the member, for the worker processes. """
+        return self.archive.zip_file().read(self.info)
+
+    def release(self):
+        """ Close the stream of the member, the next read opens it again. """
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def close(self):
+        self.release()
+        super().close()
+
+def is_archive(file)->bool:
+    # By name, workbooks are ZIP files too
+    return Path(file_name(file)).suffix.lower() == '.zip'
+
+def iter_archive(archive, suffixes:Iterable[str]=MEMBER_SUFFIXES)->Iterator[ZipMember]:
+    """
+    Members of a ZIP archive with one of suffixes, in the order of the archive.
+    The archive is opened once for all of them and closed when the
+    iteration ends, see ZipArchive.
+
+    Args:
+        archive: Path or file object of the archive.
+    """
+    archive = ZipArchive(archive)
+    suffixes = tuple(suffixes)
+    try:
+        for info in archive.zip_file().infolist():
+            if not info.is_dir() and PurePosixPath(info.filename).suffix.lower() in suffixes:
+                yield ZipMember(archive, info)
+    finally:
+        archive.close()
+
+def expand_archives(files:Iterable, suffixes:Iterable[str]=MEMBER_SUFFIXES)->Iterator:
+    """
+    Yield files, and the members of the ZIP archives among them instead of
+    the archives.
+    """
+    suffixes = tuple(suffixes)
+    for file in files:
+        if is_archive(file):
+            yield from iter_archive(file, suffixes)
+        else:
+            yield file
+
+def read_header(file, size:int=HEADER_BYTES)->List[str]:
+    """
+    Returns:
+        _type_: Complete lines in the first size bytes of file. File objects
+        are rewound.
+    """
+    if isinstance(file, (str, Path)):
+        with open(file, 'rb') as stream:
+            head = stream.read(size)
+    else:
+        file.seek(0)
+        head = file.read(size)
+        file.seek(0)
+    lines = head.decode('utf-8', errors='replace').splitlines()
+    if len(head) == size and len(lines) > 1:
+        # The last line can be cut
+        lines = lines[:-1]
+    return lines
+
+def header_columns(lines:List[str])->List[str]:
+    """ Column names of a RION file, in the line after the title. """
+    if len(lines) < 2:
+        return []
+    return [column.strip().strip('"') for column in lines[1].split(',')]
+
+class Loader(NamedTuple):
+    """
+    A measurement format.
+
+    matches takes the name of the file and its header lines. vibrations is
+    the Vibrations subclass that reads the format, if it is a vibration
+    measurement. unsupported is the error of formats that are recognised but
+    cannot be read yet, their files are listed by unsupported_errors.
+    """
+    name: str
+    measurement: Literal['Vibration', 'Octave', 'Noise']
+    matches: Callable[[str, List[str]], bool]
+    vibrations: Optional[Type[Vibrations]] = None
+    unsupported: Optional[str] = None
+
+# Formats by name, tried in order
+LOADERS:Dict[str, Loader] = {}
+
+def register_loader(loader:Loader)->Loader:
+    LOADERS[loader.name] = loader
+    return loader
+
+def _is_sentry(name:str, lines:List[str])->bool:
+    return 'SENTRY' in name.upper() or bool(lines) and 'SENTRY' in lines[0].upper()
+
+# Files without a column line are recognised by their RION name, so empty
+# files are reported by the analysis instead of being skipped
+def _is_rion_inst(name:str, lines:List[str])->bool:
+    if len(lines) < 2:
+        return is_inst_file(PurePosixPath(name))
+    return set(RIONParser.COLUMNS) <= set(header_columns(lines))
+
+def _is_rion_calc(name:str, lines:List[str])->bool:
+    if len(lines) < 2:
+        return is_calc_file(name)
+    columns = header_columns(lines)
+    return 'Start Time' in columns and any(parse_band_column(column) for column in columns)
+
+def _is_noise_log(name:str, lines:List[str])->bool:
+    columns = header_columns(lines)
+    return 'Start Time' in columns and any(column in LEVEL_COLUMNS for column in columns)
+
+register_loader(Loader('sentry', 'Vibration', _is_sentry, unsupported='SENTRY files are not supported'))
+register_loader(Loader('rion_inst', 'Vibration', _is_rion_inst, RIONVibrations))
+register_loader(Loader('rion_calc', 'Octave', _is_rion_calc))
+register_loader(Loader('noise', 'Noise', _is_noise_log))
+
+def sniff_format(file)->Optional[Loader]:
+    """
+    Returns:
+        _type_: The first loader of LOADERS that matches the header of file,
+        or None for files that are not measurements.
+    """
+    name = file_name(file)
+    if Path(name).suffix.lower() not in MEASUREMENT_SUFFIXES:
+        return None
+    try:
+        lines = read_header(file)
+    except OSError:
+        return None
+    for loader in LOADERS.values():
+        if loader.matches(name, lines):
+            return loader
+    return None
+
+def classify(files:Iterable)->Dict[str, List]:
+    """
+    Sort files by format, reading only their headers. ZIP archives are
+    replaced by their members.
+
+    Returns:
+        _type_: Files by loader name, with 'other' for files of no format,
+        such as baseline workbooks.
+    """
+    formats:Dict[str, List] = {name: [] for name in LOADERS}
+    formats['other'] = []
+    with span('sniff'):
+        for file in expand_archives(files):
+            loader = sniff_format(file)
+            formats[loader.name if loader else 'other'].append(file)
+            if isinstance(file, ZipMember):
+                # Only the header was read, the stream is opened again when the file is processed
+                file.release()
+    return formats
+
+def close_archives(files:Iterable):
+    """ Close the archives of the ZIP members among files. """
+    for archive in {file.archive for file in files if isinstance(file, ZipMember)}:
+        archive.close()
+
+def unsupported_errors(formats:Dict[str, List])->Dict[str, str]:
+    """
+    Returns:
+        _type_: Error of every file of an unsupported format in formats, see
+        classify, by file name.
+    """
+    return {file_name(file): f'ValueError: {LOADERS[name].unsupported}'
+            for name, files in formats.items()
+            if name in LOADERS and LOADERS[name].unsupported
+            for file in files}
+
+def find_files(folder:str|Path)->Dict[str, List]:
+    """
+    Returns:
+        _type_: Files under folder by format, see classify, including the
+        members of ZIP archives. folder can also be a ZIP archive.
+    """
+    folder = Path(folder)
+    paths = [folder] if folder.is_file() else sorted(path for path in folder.rglob('*') if path.is_file())
+    return classify(paths)
+
+def open_measurement(file, **kwargs)->Vibrations:
+    """
+    Returns:
+        _type_: Object of the Vibrations subclass of the format of file.
+        kwargs are passed to it, e.g. baseline.
+    """
+    loader = sniff_format(file)
+    if loader is not None and loader.unsupported:
+        raise ValueError(f'{file_name(file)}: {loader.unsupported}')
+    if loader is None or loader.vibrations is None:
+        raise ValueError(f'{file_name(file)} is not a known vibration measurement')
+    return loader.vibrations(file, **kwargs)
@@ -0,0 +1,177 @@
+"""
+Sound level meter logs.
+
+Logs have a header line, then one row per record with 'Start Time' and the
+sound level of the record in dB, in the first column of LEVEL_COLUMNS found
+in the file. Only those two columns are read, the levels as float32, and the
+timestamps are kept as a datetime64 array.
+
+Leq, Lmax, Lmin and the percentile levels of all the files, and of the
+Diurno and Nocturno records of each file, are computed together over the
+concatenated records of every file.
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from numpy import bincount, ceil, concatenate, cumsum, errstate, float64, floor, isnan, lexsort, log10, \
+    nan, ndarray, r_, repeat, where
+from pandas import DataFrame, DatetimeIndex, MultiIndex, read_csv
+from data.profiling import span
+from documents.documents import BaseLine
+from measurements.parsers import RIONParser, sniff_timestamp_format
+from measurements.vibration import PERIODS, file_name, get_file_number, is_day
+
+# Level columns, in order of preference
+LEVEL_COLUMNS = ('Main', 'LAeq', 'Leq', 'Lp', 'LAF', 'LAS')
+# Percentile levels, the level exceeded the given percent of the time
+PERCENTILE_LEVELS = {'L10': 10, 'L50': 50, 'L90': 90}
+STATISTICS = ['Leq', 'Lmax', 'Lmin', *PERCENTILE_LEVELS]
+# Decimals of the statistics, levels are stored as float32 with about 7 digits
+LEVEL_DECIMALS = 2
+
+class NoiseLog(NamedTuple):
+    """ Records of one sound level meter log. """
+    file_number: str
+    times: ndarray
+    levels: ndarray
+
+def read_noise_log(file, level_column:Optional[str]=None)->NoiseLog:
+    """
+    Args:
+        file: Path or file object of the log.
+        level_column: Column with the levels, the first of LEVEL_COLUMNS in
+            the file if not given.
+    """
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    level_columns = (level_column,) if level_column else LEVEL_COLUMNS
+    with span('read_csv', file):
+        data = read_csv(file,
+                        skiprows=1,
+                        usecols=lambda column: column == 'Start Time' or column in level_columns)
+    found = [column for column in level_columns if column in data.columns]
+    if not found:
+        raise ValueError(f'No level column found in file, expected one of {", ".join(level_columns)}')
+    times = data['Start Time']
+    with span('to_datetime', file):
+        times = RIONParser().parse_timestamps(times, sniff_timestamp_format(times.iloc[0]) if len(times) else None)
+    return NoiseLog(get_file_number(file_name(file)),
+                    times.to_numpy(),
+                    data[found[0]].to_numpy(dtype='float32'))
+
+def get_periods(times:ndarray)->ndarray:
+    """
+    Returns:
+        _type_: 0 for the Diurno records and 1 for the Nocturno ones, with the
+        hours of Vibrations.period.
+    """
+    hours = DatetimeIndex(times).hour.to_numpy()
+    return where(is_day(hours), 0, 1)
+
+def level_statistics(groups:ndarray, levels:ndarray, count:int)->ndarray:
+    """
+    Statistics of the levels of every group, sorting all the levels once.
+
+    Args:
+        groups: Group of each level, from 0 to count - 1.
+        levels: Levels in dB. NaN levels are left out.
+        count: Number of groups.
+
+    Returns:
+        _type_: Array of shape (count, len(STATISTICS)), NaN for empty groups.
+    """
+    valid = ~isnan(levels)
+    groups = groups[valid]
+    levels = levels[valid].astype(float64)
+    order = lexsort((levels, groups))
+    groups = groups[order]
+    levels = levels[order]
+    sizes = bincount(groups, minlength=count)
+    starts = r_[0, cumsum(sizes)[:-1]]
+    empty = sizes == 0
+    last = where(empty, 0, starts + sizes - 1)
+    def at(positions:ndarray)->ndarray:
+        # Linear interpolation between the sorted levels of each group
+        lower = floor(positions).astype('int64')
+        upper = ceil(positions).astype('int64')
+        if not len(levels):
+            return positions*nan
+        lower = where(empty, 0, lower)
+        upper = where(empty, 0, upper)
+        return levels[lower] + (levels[upper] - levels[lower])*(positions - lower)
+    with errstate(invalid='ignore', divide='ignore'):
+        energy = bincount(groups, weights=10**(levels/10), minlength=count)
+        statistics = [10*log10(energy/sizes),
+                      at(last),
+                      at(where(empty, 0, starts))]
+        for percent in PERCENTILE_LEVELS.values():
+            statistics.append(at(starts + (1 - percent/100)*(sizes - 1)))
+    statistics = concatenate([statistic[:, None] for statistic in statistics], axis=1)
+    statistics[empty] = nan
+    return statistics.round(LEVEL_DECIMALS)
+
+class NoiseSummary(NamedTuple):
+    summary: DataFrame
+    periods: DataFrame
+    logs: Dict[str, NoiseLog]
+    errors: Dict[str, str]
+
+def noise_statistics(logs:List[NoiseLog])->tuple:
+    """
+    Returns:
+        _type_: Statistics by file and by file and period, in one sort of the
+        records of all the files for each table.
+    """
+    sizes = [len(log.levels) for log in logs]
+    levels = concatenate([log.levels for log in logs]) if logs else ndarray(0, 'float32')
+    times = concatenate([log.times for log in logs]) if logs else ndarray(0, 'datetime64[ns]')
+    files = repeat(range(len(logs)), sizes)
+    file_numbers = [log.file_number for log in logs]
+    by_file = DataFrame(level_statistics(files, levels, len(logs)),
+                        index=file_numbers,
+                        columns=STATISTICS)
+    periods = get_periods(times)
+    by_period = DataFrame(level_statistics(files*len(PERIODS) + periods, levels, len(logs)*len(PERIODS)),
+                          index=MultiIndex.from_product([file_numbers, PERIODS], names=['File Number', 'Period']),
+                          columns=STATISTICS)
+    by_period.insert(0, 'Records', bincount(files*len(PERIODS) + periods, minlength=len(by_period)))
+    return by_file, by_period[by_period['Records'] > 0]
+
+def get_noise_summary(files:Iterable,
+                      baseline:Optional[BaseLine]=None,
+                      level_column:Optional[str]=None)->NoiseSummary:
+    """
+    Read every sound level meter log and compute its statistics.
+
+    Args:
+        files: Uploaded files or paths of logs, measurements.loaders.classify
+            picks them out of other files.
+        baseline: BaseLine of the 'Noise' sheets, adds the receiver of each file.
+        level_column: See read_noise_log.
+
+    Returns:
+        _type_: NoiseSummary with the statistics by file and by period, the
+        logs by file number and the errors by file name.
+    """
+    logs:Dict[str, NoiseLog] = {}
+    errors:Dict[str, str] = {}
+    for file in files:
+        try:
+            log = read_noise_log(file, level_column)
+        except Exception as error:
+            errors[file_name(file)] = f'{type(error).__name__}: {error}'
+            continue
+        if not len(log.levels):
+            errors[file_name(file)] = 'ValueError: The file has no measurements'
+            continue
+        logs[log.file_number] = log
+    logs = dict(sorted(logs.items()))
+    with span('noise'):
+        by_file, by_period = noise_statistics(list(logs.values()))
+    summary = DataFrame({'Start Time': [log.times.min() for log in logs.values()],
+                         'End Time': [log.times.max() for log in logs.values()]},
+                        index=by_file.index).join(by_file).rename_axis('File Number')
+    if baseline is not None:
+        summary.insert(0, BaseLine.INDEX_NAME, baseline.find_receivers(summary.index)[BaseLine.INDEX_NAME])
+    return NoiseSummary(summary, by_period, logs, errors)
+
+def noise_frame(log:NoiseLog)->DataFrame:
+    return DataFrame({'Start Time': log.times, 'Level': log.levels})
@@ -0,0 +1,293 @@
+"""
+Time rollups of the PPV tables for long campaigns.
+
+The PPV table of each file is reduced once to hourly buckets with the number
+of fixes, the maximum of every column and a histogram of its values over
+HISTOGRAM_EDGES. The 'period' (Diurno/Nocturno) and 'day' levels are built
+from the hourly buckets. Rollups of several files are merged by adding their
+counts and histograms and taking the largest maxima, so views of a campaign
+read the level that matches their zoom instead of the PPV tables, and the
+percentiles of a bucket come from its histogram.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from numpy import add, arange, bincount, concatenate, cumsum, digitize, errstate, float64, full, isnan, \
+    log10, logspace, maximum, minimum, nan, ndarray, r_, take_along_axis, where, zeros
+from pandas import DataFrame, DatetimeIndex, Timestamp, concat
+from data.profiling import span
+from measurements.vibration import PERIODS, is_day
+
+PPV_COLUMNS = ['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']
+# From the finest to the coarsest
+LEVELS = ('hour', 'period', 'day')
+# Bin edges in m/s, 20 bins per decade. Values out of the range count in the first or last bin
+HISTOGRAM_EDGES = logspace(-5, 1, 121)
+BINS = len(HISTOGRAM_EDGES) - 1
+
+class Rollup:
+    """
+    Aggregates of a set of time buckets.
+
+    keys has a row per bucket, 'Start Time' and any other key such as
+    'Receivers' or 'Period'. counts, maxima and histograms are aligned with
+    it, with shapes (buckets,), (buckets, columns) and (buckets, columns, bins).
+    """
+    def __init__(self, keys:DataFrame, counts:ndarray, maxima:ndarray, histograms:ndarray):
+        self.keys = keys.reset_index(drop=True)
+        self.counts = counts
+        self.maxima = maxima
+        self.histograms = histograms
+
+    def __len__(self)->int:
+        return len(self.keys)
+
+    @classmethod
+    def empty(cls, keys:List[str])->'Rollup':
+        return cls(DataFrame(columns=keys),
+                   zeros(0, 'int64'),
+                   zeros((0, len(PPV_COLUMNS))),
+                   zeros((0, len(PPV_COLUMNS), BINS), 'uint32'))
+
+    @classmethod
+    def from_ppvs(cls, ppvs:DataFrame)->'Rollup':
+        """
+        Returns:
+            _type_: Hourly rollup of a PPV table, in one pass over its fixes.
+        """
+        ppvs = ppvs.dropna(subset=['Start Time']).sort_values('Start Time')
+        if ppvs.empty:
+            return cls.empty(['Start Time'])
+        hours = DatetimeIndex(ppvs['Start Time']).floor('h')
+        starts = r_[0, (hours[1:] != hours[:-1]).nonzero()[0] + 1]
+        values = ppvs[PPV_COLUMNS].to_numpy(float64)
+        maxima = maximum.reduceat(where(isnan(values), -float('inf'), values), starts, axis=0)
+        counts = add.reduceat((~isnan(values[:, -1])).astype('int64'), starts)
+        buckets = zeros(len(values), 'int64')
+        buckets[starts[1:]] = 1
+        buckets = cumsum(buckets)
+        return cls(DataFrame({'Start Time': hours[starts]}),
+                   counts,
+                   where(maxima == -float('inf'), nan, maxima),
+                   _histograms(buckets, values, len(starts)))
+
+    def regroup(self, keys:DataFrame)->'Rollup':
+        """
+        Merge the buckets with the same keys.
+
+        Args:
+            keys: New keys of each bucket, aligned with self.keys.
+        """
+        if not len(self):
+            return Rollup.empty(list(keys.columns))
+        keys = keys.reset_index(drop=True)
+        groups = keys.groupby(list(keys.columns), sort=True, dropna=False).ngroup().to_numpy()
+        order = groups.argsort(kind='stable')
+        groups = groups[order]
+        starts = r_[0, (groups[1:] != groups[:-1]).nonzero()[0] + 1]
+        maxima = self.maxima[order]
+        return Rollup(keys.iloc[order[starts]],
+                      add.reduceat(self.counts[order], starts),
+                      maximum.reduceat(where(isnan(maxima), -float('inf'), maxima), starts, axis=0),
+                      add.reduceat(self.histograms[order], starts, axis=0, dtype='uint32')).fix_maxima()
+
+    def fix_maxima(self)->'Rollup':
+        self.maxima = where(self.maxima == -float('inf'), nan, self.maxima)
+        return self
+
+    def select(self, mask:ndarray)->'Rollup':
+        return Rollup(self.keys[mask], self.counts[mask], self.maxima[mask], self.histograms[mask])
+
+    def percentiles(self, percents:Iterable[float], columns:Optional[List[str]]=None)->ndarray:
+        """
+        Returns:
+            _type_: Array of shape (buckets, columns, percents) from the
+            histograms, interpolated in log scale inside the bins and never
+            above the maximum of the bucket. All of PPV_COLUMNS by default.
+        """
+        percents = list(percents)
+        indices = [PPV_COLUMNS.index(column) for column in columns or PPV_COLUMNS]
+        histograms = self.histograms[:, indices]
+        maxima = self.maxima[:, indices]
+        cumulative = cumsum(histograms, axis=2, dtype='int64')
+        totals = cumulative[:, :, -1:]
+        results = full(maxima.shape + (len(percents),), nan)
+        log_edges = log10(HISTOGRAM_EDGES)
+        for index, percent in enumerate(percents):
+            rank = totals*percent/100
+            bins = minimum((cumulative < rank).sum(axis=2, keepdims=True), BINS - 1)
+            inside = take_along_axis(histograms, bins, axis=2)
+            below = take_along_axis(cumulative, bins, axis=2) - inside
+            with errstate(invalid='ignore', divide='ignore'):
+                fraction = where(inside > 0, (rank - below) / inside, 0.0)
+            value = 10**(log_edges[bins] + fraction*(log_edges[bins + 1] - log_edges[bins]))
+            value = where(totals > 0, value, nan)[:, :, 0]
+            results[:, :, index] = minimum(value, maxima)
+        return results
+
+    def table(self, percents:Iterable[float]=(50, 90, 99), columns:Optional[List[str]]=None)->DataFrame:
+        """
+        Returns:
+            _type_: A row per bucket with its keys, 'Fixes', the maximum of
+            every column and its percentiles, e.g. 'PVS_P90'.
+        """
+        percents = list(percents)
+        columns = columns or PPV_COLUMNS
+        table = self.keys.copy()
+        table['Fixes'] = self.counts
+        for column in columns:
+            table[f'{column}_Max'] = self.maxima[:, PPV_COLUMNS.index(column)]
+        values = self.percentiles(percents, columns)
+        for index, column in enumerate(columns):
+            for position, percent in enumerate(percents):
+                table[f'{column}_P{percent:g}'] = values[:, index, position]
+        return table
+
+def _histograms(buckets:ndarray, values:ndarray, count:int)->ndarray:
+    # A single bincount over (bucket, column, bin) codes
+    bins = minimum(maximum(digitize(values, HISTOGRAM_EDGES) - 1, 0), BINS - 1)
+    columns = arange(values.shape[1])
+    codes = (buckets[:, None]*len(columns) + columns)*BINS + bins
+    counts = bincount(codes[~isnan(values)], minlength=count*len(columns)*BINS)
+    return counts.reshape(count, len(columns), BINS).astype('uint32')
+
+def period_start(times:DatetimeIndex)->DatetimeIndex:
+    """
+    Returns:
+        _type_: Start of the Diurno or Nocturno period of each time. Nocturno
+        starts the day before for the hours after midnight.
+    """
+    hours = times.hour.to_numpy()
+    days = times.floor('D')
+    first_hour = where(is_day(hours), 8, 21)
+    previous_day = hours <= 7
+    return days + (first_hour*3600 - previous_day*86400).astype('timedelta64[s]')
+
+class RollupPyramid:
+    """
+    Rollups of the same buckets at every level of LEVELS.
+    """
+    def __init__(self, levels:Dict[str, Rollup]):
+        self.levels = levels
+
+    def __getitem__(self, level:str)->Rollup:
+        return self.levels[level]
+
+    @classmethod
+    def from_hours(cls, hours:Rollup)->'RollupPyramid':
+        """ Build the coarser levels from an hourly rollup. """
+        keys = hours.keys.drop(columns='Start Time')
+        times = DatetimeIndex(hours.keys['Start Time'])
+        period = keys.assign(**{'Start Time': period_start(times),
+                                'Period': where(is_day(times.hour.to_numpy()), PERIODS[0], PERIODS[1])})
+        day = keys.assign(**{'Start Time': times.floor('D')})
+        return cls({'hour': hours,
+                    'period': hours.regroup(period),
+                    'day': hours.regroup(day)})
+
+    @classmethod
+    def from_ppvs(cls, ppvs:DataFrame)->'RollupPyramid':
+        with span('rollup'):
+            return cls.from_hours(Rollup.from_ppvs(ppvs))
+
+    @property
+    def nbytes(self)->int:
+        return sum(rollup.histograms.nbytes + rollup.maxima.nbytes + rollup.counts.nbytes
+                   for rollup in self.levels.values())
+
+    def choose_level(self, start:Optional[Timestamp]=None,
+                     end:Optional[Timestamp]=None,
+                     max_buckets:int=1000)->str:
+        """
+        Returns:
+            _type_: The finest level with at most max_buckets buckets between
+            start and end, for each value of the other keys.
+        """
+        for level in LEVELS:
+            keys = self.select(level, start, end).keys
+            others = [column for column in keys.columns if column not in ('Start Time', 'Period')]
+            buckets = keys.groupby(others).size().max() if others and len(keys) else len(keys)
+            if buckets <= max_buckets:
+                return level
+        return LEVELS[-1]
+
+    def select(self, level:str, start:Optional[Timestamp]=None, end:Optional[Timestamp]=None)->Rollup:
+        rollup = self.levels[level]
+        if start is None and end is None:
+            return rollup
+        times = rollup.keys['Start Time']
+        mask = (times >= (start if start is not None else times.min())) & \
+            (times <= (end if end is not None else times.max()))
+        return rollup.select(mask.to_numpy())
+
+    def view(self,
+             level:str='auto',
+             start:Optional[Timestamp]=None,
+             end:Optional[Timestamp]=None,
+             percents:Iterable[float]=(50, 90, 99),
+             by:Optional[List[str]]=None,
+             max_buckets:int=1000,
+             columns:Optional[List[str]]=None)->DataFrame:
+        """
+        Table of a level, reading only the pre-aggregated buckets.
+
+        Args:
+            level: One of LEVELS, or 'auto' for choose_level.
+            start, end: Time range of the buckets.
+            percents: Percentiles of each column.
+            by: Keys kept besides the time of the buckets, e.g. ['Receivers'].
+                The other keys are merged, so by=[] gives the whole campaign.
+            max_buckets: See choose_level.
+            columns: Columns of PPV_COLUMNS in the table, all by default.
+        """
+        if level == 'auto':
+            level = self.choose_level(start, end, max_buckets)
+        rollup = self.select(level, start, end)
+        if by is not None:
+            keys = [*by, 'Start Time', *(['Period'] if level == 'period' else [])]
+            # Buckets are already merged by their own keys
+            if sorted(keys) != sorted(rollup.keys.columns):
+                rollup = rollup.regroup(rollup.keys[keys])
+        return rollup.table(percents, columns)
+
+def merge_pyramids(pyramids:Iterable[Tuple[Dict[str, str], RollupPyramid]])->RollupPyramid:
+    """
+    Merge the pyramids of several files.
+
+    Args:
+        pyramids: Pairs of keys, e.g. {'Receivers': 'R1'}, and pyramid. The
+            keys are added to every bucket of the pyramid, and buckets with
+            the same keys and time are merged.
+    """
+    pyramids = list(pyramids)
+    levels = {}
+    for level in LEVELS:
+        parts = [(keys, pyramid[level]) for keys, pyramid in pyramids if len(pyramid[level])]
+        if not parts:
+            names = list(pyramids[0][0]) if pyramids else []
+            levels[level] = Rollup.empty([*names, 'Start Time', *(['Period'] if level == 'period' else [])])
+            continue
+        keys = concat([rollup.keys.assign(**file_keys) for file_keys, rollup in parts], ignore_index=True)
+        merged = Rollup(keys,
+                        concatenate([rollup.counts for _, rollup in parts]),
+                        concatenate([rollup.maxima for _, rollup in parts]),
+                        concatenate([rollup.histograms for _, rollup in parts]))
+        columns = [*parts[0][0], 'Start Time', *(['Period'] if level == 'period' else [])]
+        levels[level] = merged.regroup(keys[columns])
+    return RollupPyramid(levels)
+
+def file_rollup(vibration)->RollupPyramid:
+    """
+    Returns:
+        _type_: Pyramid of a Vibrations object, computed once and kept with
+        its other results.
+    """
+    return vibration._cached('rollup', lambda: RollupPyramid.from_ppvs(vibration.ppvs))
+
+def campaign_rollup(objects:Dict[str, object])->RollupPyramid:
+    """
+    Returns:
+        _type_: Pyramids of every file merged by receiver, the file number
+        is used for files without a receiver.
+    """
+    with span('rollup_merge'):
+        return merge_pyramids(({'Receivers': vibration.receiver or file_number}, file_rollup(vibration))
+                              for file_number, vibration in objects.items())
@@ -1,10 +1,28 @@
 from abc import ABC, abstractmethod
 from numpy import sqrt
-from pandas import DataFrame, Series, Timestamp, read_csv, to_datetime
+from pandas import DataFrame, Series, Timestamp, concat, to_datetime
+from pandas.util import hash_pandas_object
+from pathlib import Path, PurePath
 from re import search
-from typing import Literal, Optional
-from data.data_management import outliers_to_median
+from typing import Dict, Literal, NamedTuple, Optional
+from uuid import uuid4
+from weakref import finalize
+from data.cache import ParquetCache, file_digest, file_size
+from data.data_management import replace_outliers
+from data.profiling import span
+from data.store import MeasurementStore
 from documents.documents import BaseLine
+from measurements.parsers import RIONParser
+
+SUMMARY_COLUMNS = ['Start Time', 'X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']
+PERIODS = ('Diurno', 'Nocturno')
+
+def get_file_number(file_name:str)->str:
+    return str(search(r'_(\d){4}_', file_name).group()[1:-1])
+
+def is_day(hour):
+    """ Whether hour is in the Diurno period, hour can also be an array of hours. """
+    return (7 < hour) & (hour < 21)
 
 def get_receiver_name(file_number:str, receivers_data:DataFrame):
         idx = receivers_data.isin((file_number,))
@@ -12,11 +30,84 @@ def get_receiver_name(file_number:str, receivers_data:DataFrame):
 
 class Vibrations(ABC):
     COLUMNS = ('Start Time', 'X_AP', 'Y_AP', 'Z_AP', 'PVS')
-    def __init__(self, file_path, baseline:Optional[BaseLine] = None):
+    # Results kept in the MeasurementStore instead of the object, when there is one
+    STORED_RESULTS = ('non_outliers',)
+    def __init__(self, file_path,
+                 baseline:Optional[BaseLine] = None,
+                 store:Optional[MeasurementStore] = None):
         self.file_path = file_path
         self.baseline = baseline
-        self._nonOutliersData = DataFrame()
+        self.store = store
         self.replace_outliers = False
+        self._results = {}
+        self._store_id = uuid4().hex
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _cached(self, key:str, compute):
+        """
+        Return the computed result stored under key, computing it on a miss.
+
+        Results are kept until invalidate is called, so callers must not
+        modify the returned objects in place.
+        """
+        if self.store is not None and key in self.STORED_RESULTS:
+            result = self.store.get(self._store_key(key))
+            if result is not None:
+                self.cache_hits += 1
+                return result
+            self.cache_misses += 1
+            result = compute()
+            self._store_put(key, result)
+            return result
+        if key in self._results:
+            self.cache_hits += 1
+            return self._results[key]
+        self.cache_misses += 1
+        result = compute()
+        self._results[key] = result
+        return result
+
+    def invalidate(self, *keys:str):
+        """
+        Drop computed results. Without keys the whole cache is cleared.
+        """
+        if not keys:
+            self._results.clear()
+            keys = self.STORED_RESULTS
+        for key in keys:
+            self._results.pop(key, None)
+            if self.store is not None and key in self.STORED_RESULTS:
+                self.store.discard(self._store_key(key))
+
+    def _store_key(self, key:str)->str:
+        return f'{self._store_id}-{key}'
+
+    def _store_put(self, key:str, frame:DataFrame):
+        store_key = self._store_key(key)
+        if store_key not in self.store:
+            # Frames of objects that are no longer used leave the store with them
+            finalize(self, self.store.discard, store_key)
+        self.store.put(store_key, frame)
+
+    def release(self):
+        """ Remove the frames of this object from the store. """
+        if self.store is not None:
+            self.store.discard(*(self._store_key(key) for key in self.STORED_RESULTS + ('raw',)))
+
+    @property
+    def cache_info(self)->dict:
+        return {'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'size': len(self._results)}
+
+    @property
+    def ppvs(self)->DataFrame:
+        """
+        Returns:
+            _type_: Cached result of process_data, the PPV values of each fix.
+        """
+        return self._cached('ppvs', self.process_data)
 
     @property
     def receiver(self):
@@ -24,14 +115,24 @@ class Vibrations(ABC):
             return None
         return self.baseline.find_receiver_from_fileNumber(self.file_number)
 
+    @property
+    def fingerprint(self)->int:
+        """
+        Returns:
+            _type_: Hash of the PPV table, identifies the data in shared caches.
+        """
+        return self._cached('fingerprint', lambda: int(hash_pandas_object(self.ppvs).sum()))
+
     @property
     def start_time(self)->Timestamp:
-        return self.process_data()['Start Time'].min()
+        return self._cached('start_time', lambda: self.ppvs['Start Time'].min())
     
     @property
     def period(self)->str:
-        hour = self.start_time.hour
-        if 7<hour and hour<21:
+        return self._cached('period', self._get_period)
+
+    def _get_period(self)->str:
+        if is_day(self.start_time.hour):
             return 'Diurno'
         return 'Nocturno'
 
@@ -46,15 +147,11 @@ class Vibrations(ABC):
         Returns:
             _type_: DataFrame with outliers replaced by median values
         """
-        if not self._nonOutliersData.empty:
-            return self._nonOutliersData
-        non_outliers = self.process_data()
-        non_outliers['X_PPV'] = outliers_to_median(data=non_outliers['X_PPV'])
-        non_outliers['Y_PPV'] = outliers_to_median(data=non_outliers['Y_PPV'])
-        non_outliers['Z_PPV'] = outliers_to_median(data=non_outliers['Z_PPV'])
-        non_outliers['PVS'] = outliers_to_median(data=non_outliers['PVS'])
-        self._nonOutliersData = non_outliers
-        return non_outliers
+        return self._cached('non_outliers', self._replace_outliers)
+
+    def _replace_outliers(self)->DataFrame:
+        with span('outliers', self.file_path):
+            return replace_outliers(self.ppvs, columns=['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS'])
     
     @property
     def max_pvs(self)->Series:
@@ -63,9 +160,7 @@ class Vibrations(ABC):
         Returns:
             _type_: Series with the maximum value of the measurement.
         """
-        ppvs = self.process_data()
-        max_pvs = ppvs['PVS'].idxmax()
-        return max_pvs
+        return self._cached('max_pvs', lambda: self.ppvs['PVS'].idxmax())
 
     @property
     @abstractmethod
@@ -92,27 +187,118 @@ class Vibrations(ABC):
 
     @property
     def data(self)->DataFrame:
+        return self._select_data()
+
+    def _select_data(self)->DataFrame:
         if self.replace_outliers:
             return self._outliers_to_median
-        return self.process_data()
+        return self.ppvs
 
 class RIONVibrations(Vibrations):
 
-    def __init__(self, file_path:str, baseline:Optional[BaseLine]=None):
-        super().__init__(file_path, baseline)
-        self._data = self._load_data()
-        self.summary = self.process_data()
+    def __init__(self, file_path:str, 
+                 baseline:Optional[BaseLine]=None,
+                 chunksize:Optional[int]=None,
+                 cache:Optional[ParquetCache]=None,
+                 parser:Optional[RIONParser]=None,
+                 store:Optional[MeasurementStore]=None):
+        """
+        Args:
+            file_path: Path or file object of a RION Inst file.
+            baseline: BaseLine used to find the receiver of the file.
+            chunksize: If given, the file is read in chunks of that many rows
+                and only the PPV values of each fix are kept. The raw data is
+                not available in this mode.
+            cache: ParquetCache where the parsed data and the PPV values are
+                stored by the content of the file. When the PPV values are
+                cached, the parsed data is only read if it is used.
+            parser: RIONParser profile used to read the file.
+            store: MeasurementStore that holds the raw data and the table
+                without outliers, so they can be spilled to disk.
+        """
+        super().__init__(file_path, baseline, store)
+        self.chunksize = chunksize
+        self.cache = cache
+        self.parser = parser or RIONParser()
+        self._cache_key = file_digest(file_path, self.parser.version) if cache else None
+        # The raw data is read when it is first needed, a cached PPV table does not need it
+        self._raw_data = None
+        self._data_loaded = False
+        self.summary = self.ppvs
+
+    @classmethod
+    def from_ppvs(cls,
+                  file_name:str,
+                  ppvs:DataFrame,
+                  baseline:Optional[BaseLine]=None,
+                  store:Optional[MeasurementStore]=None):
+        """
+        Build an object from a PPV table computed elsewhere, e.g. in a worker
+        process. The raw data is not available, only the PPV values of each fix.
+        """
+        rion_file = cls.__new__(cls)
+        Vibrations.__init__(rion_file, PurePath(file_name), baseline, store)
+        rion_file.chunksize = None
+        rion_file.cache = None
+        rion_file.parser = None
+        rion_file._cache_key = None
+        rion_file._raw_data = None
+        rion_file._data_loaded = True
+        rion_file._results['ppvs'] = ppvs
+        rion_file.summary = ppvs
+        return rion_file
+
+    @property
+    def _data(self)->DataFrame|None:
+        if not self._data_loaded:
+            self._set_data(self._load_data())
+        if self.store is None or self._raw_data is not None:
+            return self._raw_data
+        # Read back from disk if the store spilled it
+        return self.store.get(self._store_key('raw'))
+
+    @_data.setter
+    def _data(self, data:DataFrame|None):
+        # New input data makes every computed result stale
+        self.invalidate()
+        self._set_data(data)
+
+    def _set_data(self, data:DataFrame|None):
+        self._data_loaded = True
+        if self.store is None or data is None:
+            self._raw_data = data
+            if self.store is not None:
+                self.store.discard(self._store_key('raw'))
+            return
+        self._raw_data = None
+        self._store_put('raw', data)
+
+    def _has_data(self)->bool:
+        if self._raw_data is not None:
+            return True
+        return self.store is not None and self._store_key('raw') in self.store
+
     @property
     def file_number(self):
-        return str(search(r'_(\d){4}_', self.file_path.name).group()[1:-1])
+        return get_file_number(file_name(self.file_path))
 
-    def _load_data(self)->DataFrame:
-        # Implementación específica para cargar datos de archivos RION
-        data = read_csv(self.file_path, 
-                        skiprows=1)
-        data['Start Time'] = to_datetime(data['Start Time'],
-                                 yearfirst=True)
+    def _load_data(self)->DataFrame|None:
+        if self.chunksize:
+            return None
+        if self.cache:
+            data = self.cache.get(self._cache_key, 'raw', file_size(self.file_path))
+            if data is not None:
+                return data
+        data = self._read_data()
+        if self.cache:
+            self.cache.put(self._cache_key, 'raw', data)
         return data
+
+    def _read_data(self)->DataFrame:
+        # Implementación específica para cargar datos de archivos RION
+        with span('parse', self.file_path):
+            return self.parser.read(self.file_path)
+
     def process_data(self)->DataFrame:
         """ 
         Returns a DataFrame representation of the measurement data. 
@@ -122,12 +308,62 @@ class RIONVibrations(Vibrations):
         Returns:
             _type_: DataFrame
         """
-        self._data['fix'] = (self._data['Address']-1)//10
-        ppvs:DataFrame = self._data.groupby('fix')[['Start Time', 'X_AP', 'Y_AP', 'Z_AP']]
-        ppvs = ppvs.max()
+        if self.cache:
+            # Parsing is only skipped here when the raw data was not loaded
+            source_size = 0 if self._has_data() else file_size(self.file_path)
+            ppvs = self.cache.get(self._cache_key, 'ppvs', source_size)
+            if ppvs is not None:
+                return ppvs
+        if self.chunksize:
+            with span('stream', self.file_path):
+                ppvs = self._process_chunks()
+        else:
+            with span('group', self.file_path):
+                ppvs = self._add_pvs(self._group_fixes(self._data))
+        if self.cache:
+            self.cache.put(self._cache_key, 'ppvs', ppvs)
+        return ppvs
+
+    @staticmethod
+    def _group_fixes(data:DataFrame)->DataFrame:
+        # Each fix is a group of 10 addresses, its PPV is the maximum of the group
+        fix = ((data['Address']-1)//10).rename('fix')
+        return data.groupby(fix)[['Start Time', 'X_AP', 'Y_AP', 'Z_AP']].max()
+
+    @staticmethod
+    def _add_pvs(ppvs:DataFrame)->DataFrame:
         ppvs['PVS'] = sqrt(ppvs['X_AP']**2 + ppvs['Y_AP']**2 + ppvs['Z_AP']**2)
         return ppvs.rename(columns={'X_AP': 'X_PPV', 'Y_AP': 'Y_PPV', 'Z_AP':'Z_PPV'})
 
+    def _process_chunks(self)->DataFrame:
+        """
+        Read the file in chunks and reduce each chunk to the maxima of its fixes.
+
+        The last fix of a chunk can continue in the next one, so its partial
+        maxima are held back and merged with the next chunk. Only the rows of
+        one chunk are in memory at any time, besides the PPV table itself.
+        """
+        if hasattr(self.file_path, 'seek'):
+            self.file_path.seek(0)
+        completed = []
+        pending = None
+        for chunk in self.parser.read_chunks(self.file_path, self.chunksize):
+            partial = self._group_fixes(chunk)
+            if pending is not None:
+                partial = concat([pending, partial]).groupby(level=0).max()
+            pending = partial.iloc[-1:]
+            if len(partial) > 1:
+                completed.append(partial.iloc[:-1])
+        if pending is not None:
+            completed.append(pending)
+        if not completed:
+            return self._add_pvs(DataFrame(columns=['Start Time', 'X_AP', 'Y_AP', 'Z_AP']))
+        ppvs = concat(completed)
+        if not ppvs.index.is_unique:
+            # Addresses out of order: the same fix was completed more than once
+            ppvs = ppvs.groupby(level=0).max()
+        return self._add_pvs(ppvs).sort_index()
+
     def __getitem__(self, key:Literal['X_AP', 'Y_AP', 'Z_AP'])->Series:
         return self._data[key]
 
@@ -139,3 +375,62 @@ class SENTRYVibrations(Vibrations):
     def process_data(self):
         # Implementación específica para procesar datos de archivos SENTRY
         print("Processing SENTRY data...")
+
+
+class VibrationSummary(NamedTuple):
+    summary: DataFrame
+    summary_non_outliers: DataFrame
+    objects: Dict[str, RIONVibrations]
+    errors: Dict[str, str]
+
+def is_inst_file(file)->bool:
+    return 'Inst' in file_name(file).split('_')
+
+def get_max_pvs_row(ppvs:DataFrame)->Series:
+    """
+    Returns:
+        _type_: Row of the PPV table where the PVS is maximum.
+    """
+    return ppvs.loc[ppvs['PVS'].idxmax(), SUMMARY_COLUMNS]
+
+def build_summary(rows:Dict[str, Series])->DataFrame:
+    """
+    Build a summary table in one step from the rows collected for each file.
+    """
+    if not rows:
+        return DataFrame(columns=SUMMARY_COLUMNS)
+    return DataFrame.from_dict(rows, orient='index', columns=SUMMARY_COLUMNS)
+
+def file_name(file)->str:
+    return Path(file).name if isinstance(file, str) else file.name
+
+def _result_key(name:str)->str:
+    try:
+        return get_file_number(name)
+    except AttributeError:
+        return name
+
+def file_identity(file)->tuple:
+    """
+    Cheap identity of a file, checked before hashing its content: path, size
+    and modification time of files on disk, or name, size and upload id of
+    uploaded files.
+    """
+    if isinstance(file, (str, Path)):
+        stat = Path(file).stat()
+        return (str(file), stat.st_size, stat.st_mtime_ns)
+    return (file.name, getattr(file, 'size', None), getattr(file, 'file_id', None))
+
+def format_summary(summary:DataFrame, baseline:Optional[BaseLine]=None)->DataFrame:
+    """
+    Returns:
+        _type_: Summary table as it is displayed and exported, indexed by
+        'File Number' with the receiver of each file when a baseline is given.
+    """
+    summary = summary.copy()
+    if baseline is not None:
+        summary['Receivers'] = baseline.find_receivers(summary.index)[BaseLine.INDEX_NAME]
+    summary = summary.rename(columns={'Start Time':'Measurement Time'}
+                             ).rename_axis('File Number')
+    summary['Measurement Time'] = to_datetime(summary['Measurement Time'])
+    return summary
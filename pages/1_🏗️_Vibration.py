@@ -1,23 +1,65 @@
 import streamlit as st
-from pandas import DataFrame, Series, to_datetime, concat
+from pandas import DataFrame
 from typing import Literal, Optional, Dict
-from data.data_management import export_data
-from measurements.vibration import RIONVibrations
-from documents.documents import get_receivers_path, BaseLine, FileNotFoundError, NoFilesError
-from plotly.express import box, histogram, line
+from data.export import MIME_TYPES, export_details, export_table
+from measurements.ingestion import VibrationAnalysis
+from measurements.vibration import PERIODS, RIONVibrations, file_identity, format_summary
+from measurements.events import Limits, add_events, detect_events, has_limits
+from measurements.rollups import LEVELS, PPV_COLUMNS, campaign_rollup
+from measurements.frequency import get_frequency_summary
+from measurements.loaders import classify, unsupported_errors
+from documents.documents import get_receivers_path, load_baseline, FileNotFoundError, NoFilesError
+from plotly.express import box, histogram, imshow, line
 from time import sleep
+from datetime import timedelta
+from os import cpu_count
+from pathlib import Path
+from data.cache import MemoryCache, ParquetCache
+from data.store import MeasurementStore
+from data.profiling import Profiler, deactivate, span
+from data.downsampling import downsample_indices
 
 HELP_PPV_CHECKER = """
     The ppv value of vibration data in "AP" column is calculated for each axis.
     PPV get the maximum value of data for each axis."""
 
 HELP_FREQ_CHECKER = """
-This option is not available yet."""
+    The OCT Calc files are read to get the maximum and the mean of each band.
+    The band with the highest maximum of each axis is added to the summary."""
+
+HELP_LIMITS = """
+    Intervals where the PVS or the PPV of any axis is over the limit of its
+    period are listed as events. Leave a limit empty to not check it."""
+
+HELP_DOWNSAMPLING = """
+minmax keeps the minimum and maximum of every interval, so no peak is lost.
+lttb follows the shape of the series and keeps its maximum."""
+
+#Default number of points of the line chart, about its width in pixels
+LINE_CHART_POINTS = 1000
+#Smallest change of the time range of the chart, Streamlit uses 15 minutes or a day otherwise
+TIME_RANGE_STEP = timedelta(seconds=1)
+#Rows read at once from each file, bounds the memory used by long recordings
+CHUNKSIZE = 100_000
+#Parsed files are kept here by content, up to CACHE_MAX_BYTES
+CACHE_DIR = Path.home() / '.cache' / 'acoustic-data-analysis'
+CACHE_MAX_BYTES = 2*1024**3
+#Memory for the tables of all sessions, the least used ones are spilled to disk
+STORE_MAX_BYTES = 1024**3
+#Results shared by all sessions, by content of the file
+SHARED_MAX_ENTRIES = 2048
+SHARED_MAX_BYTES = 512*1024**2
+BASELINES_MAX_ENTRIES = 16
+BASELINES_MAX_BYTES = 64*1024**2
+#Seconds between reruns while files are processed in the background
+POLL_SECONDS = 0.5
 
 if 'calculate_button_clicked' not in st.session_state:
     st.session_state['calculate_button_clicked'] = False
 if 'get_ppv_values' not in st.session_state:
     st.session_state.get_ppv_values = False
+if 'get_freq_values' not in st.session_state:
+    st.session_state.get_freq_values = False
 if 'uploaded_files' not in st.session_state:
     st.session_state.uploaded_files = False
 if 'receivers_file' not in st.session_state:
@@ -28,6 +70,8 @@ def process_data():
     st.session_state['calculate_button_clicked'] = not st.session_state['calculate_button_clicked']
 def get_ppv_values_callback():
     st.session_state.get_ppv_values = not st.session_state.get_ppv_values
+def get_freq_values_callback():
+    st.session_state.get_freq_values = not st.session_state.get_freq_values
 def get_values_checkbox(type:Literal['ppv', 'freq'], 
                       key:int, 
                       value:bool=False, 
@@ -40,13 +84,106 @@ def get_values_checkbox(type:Literal['ppv', 'freq'],
                     key=key,
                     disabled=disabled,
                     help=help)
+    if type == 'freq':
+        return st.checkbox('Get Frequency Values',
+                    value=value,
+                    on_change=get_freq_values_callback,
+                    key=key,
+                    disabled=disabled,
+                    help=help)
  
+@st.cache_data(max_entries=512)
+def get_downsampled_index(_dataframe:DataFrame, 
+                          fingerprint:int,
+                          replace_outliers:bool,
+                          column:str,
+                          points:int,
+                          method:str,
+                          time_range:tuple):
+    #_dataframe is not hashed, the table is identified by fingerprint and replace_outliers
+    start, end = time_range
+    times = _dataframe['Start Time']
+    data = _dataframe[(times >= start) & (times <= end)]
+    return data.index[downsample_indices(data, column, points, method, x='Start Time')]
+
+def get_line_chart_data(dataframe:DataFrame,
+                        fingerprint:int,
+                        replace_outliers:bool,
+                        points:int,
+                        method:str,
+                        time_range:tuple)->DataFrame:
+    #The points are split between the columns, so the chart gets about points rows in total
+    columns = ('X_PPV', 'Y_PPV', 'Z_PPV', 'PVS')
+    column_points = max(points // len(columns), 2)
+    index = get_downsampled_index(dataframe, fingerprint, replace_outliers, columns[0], column_points, method,
+                                  time_range)
+    for column in columns[1:]:
+        index = index.union(get_downsampled_index(dataframe, fingerprint, replace_outliers,
+                                                  column, column_points, method, time_range))
+    return dataframe.loc[index]
+
+@st.cache_resource(max_entries=4)
+def get_frequency_data(_calc_files:list, identities:tuple):
+    #The arrays are shared, not copied on every rerun. Files are identified by identities
+    return get_frequency_summary(_calc_files)
+
+def add_frequency(summary:DataFrame)->DataFrame:
+    if frequency is None:
+        return summary
+    return summary.join(frequency.statistics.summary())
+
+@st.cache_data(max_entries=8)
+def get_events(_rion_objects:Dict[str, RIONVibrations],
+               objects_key:tuple,
+               reduce_outliers:bool,
+               limits:Dict[str, Limits]):
+    #_rion_objects is identified by the fingerprints in objects_key
+    ppvs = {}
+    for file_number, rion in _rion_objects.items():
+        rion.set_replace_outliers(reduce_outliers)
+        ppvs[file_number] = rion.data
+    return detect_events(ppvs, limits)
+
+@st.cache_resource(max_entries=4)
+def get_campaign_rollup(_rion_objects:Dict[str, RIONVibrations], objects_key:tuple, receivers:tuple):
+    #Each file is rolled up once, only the merge is repeated when files change
+    return campaign_rollup(_rion_objects)
+
+def get_objects_key(rion_objects:Dict[str, RIONVibrations])->tuple:
+    return tuple((file_number, rion.fingerprint) for file_number, rion in rion_objects.items())
+
+@st.cache_data(max_entries=8)
+def get_export(summary:DataFrame,
+               file_format:str,
+               _details:Optional[Dict[str, DataFrame]]=None,
+               details_key:tuple=(),
+               events:Optional[DataFrame]=None):
+    #summary and events are hashed by content, _details is identified by details_key
+    if file_format == 'xlsx' and events is not None:
+        _details = {'Events': events, **(_details or {})}
+    return export_table(summary, file_format, _details)
+
+@st.cache_data(max_entries=4)
+def get_details_export(_details:Dict[str, DataFrame], details_key:tuple, file_format:str):
+    return export_details(_details, file_format)
+
+def get_details(rion_objects:Dict[str, RIONVibrations], reduce_outliers:bool):
+    details = {}
+    for file_number, rion in rion_objects.items():
+        rion.set_replace_outliers(reduce_outliers)
+        details[file_number] = rion.data
+    return details, (reduce_outliers, get_objects_key(rion_objects))
+
 def reset_page():
+    #Only this session is reset, the caches are shared by every session
     uploaded_files.clear()
-    st.cache_resource.clear()
-    st.cache_data.clear()
     st.session_state['calculate_button_clicked'] = False
     st.session_state['uploaded_files'] =False
+    analysis = st.session_state.pop('analysis', None)
+    if analysis is not None:
+        analysis.cancel()
+        for rion_file in analysis.objects.values():
+            rion_file.release()
     st.rerun()
 
 st.set_page_config(page_title="Vibration Analysis", 
@@ -56,7 +193,7 @@ st.markdown("# Vibration Analysis")
 sidebar = st.sidebar
 
 with st.expander('Example of folder'):
-    st.write('You can drag and drop a folder with all data from RION vibrometer like this')
+    st.write('You can drag and drop a folder with all data from RION vibrometer like this, or a ZIP file of it')
     code = '''
         Vibrations/
         │
@@ -83,7 +220,8 @@ with st.expander('Example of folder'):
 uploaded_files = sidebar.file_uploader(
     "Choose a CSV file or drag and drop a folder with all data.", 
     accept_multiple_files=True,
-    disabled=st.session_state.get('uploaded_files'))
+    help="Files can be added or removed after calculating, only the new files are processed. "
+         "ZIP files are read without extracting them")
 
 
 #Inputs to read the excel file
@@ -102,191 +240,395 @@ receivers_col = col1.text_input('Receivers column',
 memories_col = col2.text_input('Memories column', 
                                value="E",
                                disabled=st.session_state['calculate_button_clicked'])
+workers = input_container.number_input('Worker processes',
+                                      min_value=1,
+                                      value=cpu_count() or 1,
+                                      help="Number of processes used to read the files",
+                                      disabled=st.session_state['calculate_button_clicked'])
 
-#Options to process files
-st.markdown('### Select the process you want to upload')
-options = st.container(border=True)
-   
-with options:
-    #Verificar si no hay seleccionada una opcion, o 
-    if (not (st.session_state.get_ppv_values) or not uploaded_files):
-        get_ppv_values = get_values_checkbox('ppv', 
-                                              key=1,
-                                              help=HELP_PPV_CHECKER)
-        calculate = options.button('Go Calculate!', disabled=True)
-    elif not st.session_state['calculate_button_clicked']:
-        get_ppv_values = get_values_checkbox('ppv', 
-                                              key=3, 
-                                              value=st.session_state.get_ppv_values,
-                                              help=HELP_PPV_CHECKER)
-        calculate = options.button('Go Calculate!', 
-                                   disabled=False, 
-                                   on_click=process_data)
-    elif st.session_state['calculate_button_clicked']:
-        get_ppv_values = get_values_checkbox('ppv', 
-                                              key=3, 
-                                              value=st.session_state.get_ppv_values, 
-                                              disabled=True)
-        calculate = options.button('Go Calculate!', disabled=True)
-
-get_ppv_values = st.session_state.get_ppv_values
-calculate = st.session_state['calculate_button_clicked']
-
-if not(get_ppv_values and calculate):
-    st.warning('Please upload files')
-    st.stop()    
-
-std_df = DataFrame(columns=['X_STD', 'Y_STD', 'Z_STD'])
-rion_objects:Dict[str, RIONVibrations] = {}
-
-#Get the list of receivers from a excel file
-@st.cache_data
-def get_receivers_data(uploaded_files):
-    receivers_path = get_receivers_path(uploaded_files)
-    baseline = BaseLine(receivers_path)
-    return baseline
+limits_container = sidebar.container(border=True)
+limits_container.markdown('Limits [m/s]', help=HELP_LIMITS)
+limits = {}
+for column, period in zip(limits_container.columns(2), PERIODS):
+    limits[period] = Limits(pvs=column.number_input(f'PVS {period}', min_value=0.0, value=None, format='%.4f'),
+                            ppv=column.number_input(f'PPV {period}', min_value=0.0, value=None, format='%.4f'))
+check_limits = has_limits(limits)
+
+@st.cache_resource(max_entries=4)
+def get_formats(_files:list, identities:tuple):
+    #Only the headers are read, ZIP archives are replaced by their members
+    return classify(_files)
+
+@st.cache_resource
+def get_parquet_cache():
+    return ParquetCache(CACHE_DIR, max_bytes=CACHE_MAX_BYTES)
+
+@st.cache_resource
+def get_measurement_store():
+    return MeasurementStore(max_bytes=STORE_MAX_BYTES)
+
+@st.cache_resource
+def get_shared_results():
+    return MemoryCache(max_entries=SHARED_MAX_ENTRIES, max_bytes=SHARED_MAX_BYTES)
 
+@st.cache_resource
+def get_shared_baselines():
+    return MemoryCache(max_entries=BASELINES_MAX_ENTRIES, max_bytes=BASELINES_MAX_BYTES)
+
+parquet_cache = get_parquet_cache()
+measurement_store = get_measurement_store()
+shared_results = get_shared_results()
+shared_baselines = get_shared_baselines()
+with sidebar.expander('Cache statistics'):
+    cache_stats = parquet_cache.stats
+    col1, col2 = st.columns(2)
+    col1.metric('Hit rate', f"{cache_stats['hit_rate']:.0%}")
+    col2.metric('MB saved', f"{cache_stats['bytes_saved']/1024**2:.1f}")
+    st.caption(f"{cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+               f"{cache_stats['size']/1024**2:.1f} of {cache_stats['max_bytes']/1024**2:.0f} MB used")
+    for label, shared in (('Shared results', shared_results), ('Shared baselines', shared_baselines)):
+        shared_stats = shared.stats
+        st.caption(f"{label}: {shared_stats['hit_rate']:.0%} hit rate, "
+                   f"{shared_stats['entries']} of {shared_stats['max_entries']} entries, "
+                   f"{shared_stats['size']/1024**2:.1f} of {shared_stats['max_bytes']/1024**2:.0f} MB")
+    store_stats = measurement_store.stats
+    st.caption(f"Tables in memory: {store_stats['memory_bytes']/1024**2:.1f} of "
+               f"{store_stats['max_bytes']/1024**2:.0f} MB, "
+               f"{store_stats['disk_bytes']/1024**2:.1f} MB spilled to disk, "
+               f"{store_stats['reloads']} reloads")
+
+diagnostics = sidebar.toggle('Diagnostics', 
+                             help="Record the time of each processing stage")
+track_memory = sidebar.toggle('Track memory',
+                              disabled=not diagnostics,
+                              help="Also record the peak memory of each stage, slows down processing")
+profiler = None
+if diagnostics:
+    profiler = Profiler(track_memory=track_memory).start()
+else:
+    deactivate()
+
+#The profiler is stopped however the run ends, st.stop and st.rerun raise
 try:
-    baseline = get_receivers_data(uploaded_files)
-except FileNotFoundError as error:
-    st.warning('Receivers file not found')
-    receivers_path = None
-    baseline = None
-    sleep(2)
-except NoFilesError as error:
-    if not st.session_state.get('uploaded_files'):
+    #Options to process files
+    st.markdown('### Select the process you want to upload')
+    options = st.container(border=True)
+   
+    with options:
+        #Verificar si no hay seleccionada una opcion, o 
+        if (not (st.session_state.get_ppv_values) or not uploaded_files):
+            get_ppv_values = get_values_checkbox('ppv', 
+                                                  key=1,
+                                                  help=HELP_PPV_CHECKER)
+            get_freq_values = get_values_checkbox('freq',
+                                                  key=2,
+                                                  value=st.session_state.get_freq_values,
+                                                  help=HELP_FREQ_CHECKER)
+            calculate = options.button('Go Calculate!', disabled=True)
+        elif not st.session_state['calculate_button_clicked']:
+            get_ppv_values = get_values_checkbox('ppv', 
+                                                  key=3, 
+                                                  value=st.session_state.get_ppv_values,
+                                                  help=HELP_PPV_CHECKER)
+            get_freq_values = get_values_checkbox('freq',
+                                                  key=4,
+                                                  value=st.session_state.get_freq_values,
+                                                  help=HELP_FREQ_CHECKER)
+            calculate = options.button('Go Calculate!', 
+                                       disabled=False, 
+                                       on_click=process_data)
+        elif st.session_state['calculate_button_clicked']:
+            get_ppv_values = get_values_checkbox('ppv', 
+                                                  key=3, 
+                                                  value=st.session_state.get_ppv_values, 
+                                                  disabled=True)
+            get_freq_values = get_values_checkbox('freq',
+                                                  key=4,
+                                                  value=st.session_state.get_freq_values,
+                                                  help=HELP_FREQ_CHECKER)
+            calculate = options.button('Go Calculate!', disabled=True)
+
+    get_ppv_values = st.session_state.get_ppv_values
+    get_freq_values = st.session_state.get_freq_values
+    calculate = st.session_state['calculate_button_clicked']
+
+    if not(get_ppv_values and calculate):
+        st.warning('Please upload files')
+        st.stop()    
+
+    std_df = DataFrame(columns=['X_STD', 'Y_STD', 'Z_STD'])
+    rion_objects:Dict[str, RIONVibrations] = {}
+    formats = get_formats(uploaded_files or [], tuple(file_identity(file) for file in uploaded_files or []))
+
+    #Get the list of receivers from a excel file, shared by all sessions by its content
+    try:
+        baseline = load_baseline(get_receivers_path((uploaded_files or []) + formats['other']), shared_baselines)
+    except FileNotFoundError as error:
+        st.warning('Receivers file not found')
+        receivers_path = None
+        baseline = None
+        sleep(2)
+    except NoFilesError as error:
+        baseline = None
+        if not st.session_state.get('uploaded_files'):
+            st.error("No compatible files were uploaded.")
+            st.session_state['calculate_button_clicked'] = False
+            sleep(2)
+            st.rerun()
+
+    #Read data from files in the background, only new or changed files are processed.
+    #The analysis is kept in session_state, so reruns while it runs do not restart it
+    analysis:VibrationAnalysis = st.session_state.get('analysis', None)
+    if analysis is None:
+        analysis = VibrationAnalysis(chunksize=CHUNKSIZE,
+                                     cache=parquet_cache,
+                                     store=measurement_store,
+                                     shared=shared_results)
+        st.session_state['analysis'] = analysis
+    analysis.workers = workers
+    analysis.update(formats['rion_inst'],
+                    baseline,
+                    background=True,
+                    profile=profiler is not None,
+                    track_memory=track_memory)
+    analysis.collect()
+    if analysis.running:
+        done, total = analysis.progress
+        col1, col2 = st.columns([5, 1])
+        col1.progress(done / total, text=f'Processing files: {done} of {total}')
+        col2.button('Cancel', on_click=analysis.cancel, help="Stop processing the files not started yet")
+    summary_df = analysis.summary
+    summary_df_non_outliers = analysis.summary_non_outliers
+    rion_objects = analysis.objects
+
+    errors = {**analysis.errors, **unsupported_errors(formats)}
+    if errors:
+        with st.expander(f'{len(errors)} files could not be processed'):
+            st.dataframe(DataFrame.from_dict(errors, orient='index', columns=['Error']),
+                         use_container_width=True)
+
+    n_files = [rion for rion in rion_objects]
+    if len(n_files)==0:
+        if analysis.running:
+            sleep(POLL_SECONDS)
+            st.rerun()
         st.error("No compatible files were uploaded.")
         st.session_state['calculate_button_clicked'] = False
         sleep(2)
         st.rerun()
+    st.session_state['uploaded_files'] = True
+    frequency = None
+    if get_freq_values:
+        calc_files = formats['rion_calc']
+        if calc_files:
+            frequency = get_frequency_data(calc_files, tuple(file_identity(file) for file in calc_files))
+    summary_df = add_frequency(format_summary(summary_df, baseline))
+    events = None
+    if check_limits:
+        events = get_events(rion_objects, get_objects_key(rion_objects), False, limits)
+        summary_df = add_events(summary_df, events)
 
-#Read data from files
-def get_summary_df(uploaded_files,
-                   baseline:Optional[BaseLine]=None,
-                   replace_outliers:Optional[bool]=False):
-    summary = DataFrame(columns=['Start Time', 'X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']) 
-    for file in uploaded_files:
-        file.seek(0)
-        file_name = file.name.split('_')
-        if 'Inst' not in file_name:
-            continue
-        rion_file = RIONVibrations(file, baseline)
-        file_number = rion_file.file_number
-        if rion_file == None:
-            continue
-        rion_file.set_replace_outliers(replace_outliers)
-        rion_objects[file_number] = rion_file
-        summary.loc[file_number] = rion_file.data.loc[rion_file.data['PVS'].idxmax()]
-    return summary
-
-summary_df = st.session_state.get('summary_df', None)
-if summary_df is None:
-    summary_df = get_summary_df(uploaded_files=uploaded_files,
-                                baseline=baseline,
-                                replace_outliers=False)
-    summary_df_non_outliers = get_summary_df(uploaded_files=uploaded_files,
-                                baseline=baseline,
-                                replace_outliers=True)
-    st.session_state['summary_df'] = summary_df
-    st.session_state['summary_df_non_outliers'] = summary_df_non_outliers
-    st.session_state['rion_objects'] = rion_objects
-    st.session_state['baseline'] = baseline
-summary_df_non_outliers = st.session_state.get('summary_df_non_outliers', None)
-rion_objects = st.session_state.get('rion_objects', None)
-baseline = st.session_state.get('baseline', None)
-
-n_files = [rion for rion in rion_objects]
-if len(n_files)==0:
-    st.error("No compatible files were uploaded.")
-    st.session_state['calculate_button_clicked'] = False
-    sleep(2)
-    st.rerun()
-st.session_state['uploaded_files'] = True
-if baseline is not None:
-    receivers_baseline = baseline.receivers
-    not_receivers_founded = receivers_baseline[receivers_baseline.isin(n_files)]
-    all_files:Series = concat([not_receivers_founded['Diurno'],
-                        not_receivers_founded['Nocturno']])
-    summary_df['Receivers'] = None
-    summary_df.loc[all_files[all_files.notna()], 'Receivers'] = all_files[all_files.notna()].index
-
-summary_df = summary_df.rename(columns={'Start Time':'Measurement Time'}
-                        ).rename_axis(
-                            'File Number'
-                            )
-summary_df['Measurement Time'] = to_datetime(summary_df['Measurement Time'])
-
-with st.expander(f'Data calculated', expanded=True):
-    st.dataframe(summary_df, use_container_width=True)
-
-with st.expander("Details of a specific measurement"):
-    reduce_outliers = st.toggle("Reduce Outliers", 
-                                value=False, 
-                                help="Replace the outliers values to the median value")
-    st.session_state['reduce_outliers'] = reduce_outliers
-    chart_selected = st.selectbox("Select a file to display the a chart with PPV values",
-                                options=summary_df.index)
-    rion_file = rion_objects[chart_selected]
-    if reduce_outliers:
-        dataframe = st.session_state.get('non_outliers_data', None)
-        if not isinstance(dataframe, DataFrame):
-            rion_file.set_replace_outliers(True)
-            dataframe = rion_file.data
-            st.session_state['non_outliers_data'] = dataframe
-            st.dataframe(DataFrame(dataframe[['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']].describe().T),
-                         use_container_width=True)
-        st.dataframe(DataFrame(dataframe[['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']].describe().T), 
-                        use_container_width=True)
-    else:
-        dataframe = st.session_state.get('original_data', None)
-        if not isinstance(dataframe, DataFrame):
-            rion_file.set_replace_outliers(False)
-            dataframe = rion_file.data
-            st.dataframe(DataFrame(dataframe[['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']].describe().T),
-                         use_container_width=True)
-            st.session_state['original_data'] = dataframe
-        else:
-            st.dataframe(DataFrame(dataframe[['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']].describe().T), 
+    with st.expander(f'Data calculated', expanded=True):
+        st.dataframe(summary_df, use_container_width=True)
+
+    if events is not None:
+        with st.expander(f'{len(events)} events over the limits'):
+            st.dataframe(events, use_container_width=True)
+
+    if get_freq_values:
+        with st.expander('Frequency analysis'):
+            if frequency is None:
+                st.info('No OCT Calc files were uploaded.')
+            else:
+                if frequency.errors:
+                    st.dataframe(DataFrame.from_dict(frequency.errors, orient='index', columns=['Error']),
+                                 use_container_width=True)
+                statistic = st.radio('Band statistic', options=['maxima', 'mean'], horizontal=True)
+                bands = frequency.statistics.table(statistic)
+                if len(bands):
+                    spectrum_selected = st.selectbox('Select a file to display its spectrum',
+                                                     options=bands.index)
+                    spectrum = bands.loc[spectrum_selected].unstack('Axis').reset_index()
+                    chart = line(spectrum,
+                                 x='Frequency [Hz]',
+                                 y=['X', 'Y', 'Z'],
+                                 log_x=True,
+                                 markers=True).update_layout(yaxis_title=f'Band {statistic}',
+                                                             legend_title='Axis')
+                    st.plotly_chart(chart, use_container_width=True)
+                    bands.columns = [f'{axis} {band:g} Hz' for axis, band in bands.columns]
+                    st.dataframe(bands, use_container_width=True)
+
+    with st.expander('Campaign overview'):
+        rollup = get_campaign_rollup(rion_objects,
+                                     get_objects_key(rion_objects),
+                                     tuple(rion.receiver for rion in rion_objects.values()))
+        col1, col2, col3 = st.columns(3)
+        overview_level = col1.selectbox('Time buckets',
+                                        options=['auto', *LEVELS],
+                                        help="auto uses the finest buckets that fit in the chart")
+        overview_column = col2.selectbox('Value', options=PPV_COLUMNS, index=PPV_COLUMNS.index('PVS'))
+        overview_statistic = col3.selectbox('Statistic', options=['Max', 'P50', 'P90', 'P99'])
+        with span('render', f'overview {overview_level}'):
+            values = f'{overview_column}_{overview_statistic}'
+            by_receiver = rollup.view(overview_level,
+                                      by=['Receivers'],
+                                      max_buckets=LINE_CHART_POINTS,
+                                      columns=[overview_column])
+            heatmap = by_receiver.pivot_table(index='Receivers', columns='Start Time', values=values)
+            st.plotly_chart(imshow(heatmap, aspect='auto', labels={'color': values}),
+                            use_container_width=True)
+            campaign = rollup.view(overview_level,
+                                   by=[],
+                                   max_buckets=LINE_CHART_POINTS,
+                                   columns=[overview_column])
+            st.plotly_chart(line(campaign,
+                                 x='Start Time',
+                                 y=[f'{overview_column}_Max', f'{overview_column}_P90', f'{overview_column}_P50']
+                                 ).update_layout(yaxis_title="Displacement [m/s]",
+                                                 legend_title="All receivers"),
                             use_container_width=True)
+
+    with st.expander("Details of a specific measurement"):
+        reduce_outliers = st.toggle("Reduce Outliers", 
+                                    value=False, 
+                                    help="Replace the outliers values to the median value")
+        st.session_state['reduce_outliers'] = reduce_outliers
+        #The options grow while files are processed, keep the selected file
+        options = summary_df.index.tolist()
+        selected = st.session_state.get('chart_selected')
+        chart_selected = st.selectbox("Select a file to display the a chart with PPV values",
+                                    options=options,
+                                    index=options.index(selected) if selected in options else 0)
+        st.session_state['chart_selected'] = chart_selected
+        rion_file = rion_objects[chart_selected]
+        #The object keeps both tables, only the selected one changes
+        rion_file.set_replace_outliers(reduce_outliers)
+        dataframe = rion_file.data
+        st.dataframe(DataFrame(dataframe[['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']].describe().T), 
+                     use_container_width=True)
     
-    chart_type = st.selectbox("Select a type of chart", 
-                                options=["Line", "Histogram", "Box"])
+        chart_type = st.selectbox("Select a type of chart", 
+                                    options=["Line", "Histogram", "Box"])
     
-    labels = ('Time, m/s')
-    if chart_type == "Histogram":
-        chart = histogram(dataframe,
-                                x=['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS'])
-    if chart_type == "Line":
-        chart = line(dataframe,
-                        x="Start Time",
-                        y=['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']).update_layout(
-                            xaxis_title = "Time [hh:mm]", 
-                            yaxis_title = "Displacement [m/s]",
-                            legend_title = "Metrics"
-                        )
-    if chart_type == "Box":
-        chart = box(dataframe,
-                        x=['PVS'])
-    #st.plotly_chart(chart, use_container_width=True)
-    col1, col2 = st.columns(2)
-    col1.plotly_chart(chart, use_container_width=True)
+        labels = ('Time, m/s')
+        with span('render', f'{chart_selected} {chart_type}'):
+            if chart_type == "Histogram":
+                chart = histogram(dataframe,
+                                        x=['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS'])
+            if chart_type == "Line":
+                col1, col2, col3 = st.columns(3)
+                chart_points = col1.number_input('Chart resolution [points]',
+                                                 min_value=100,
+                                                 max_value=20_000,
+                                                 value=LINE_CHART_POINTS,
+                                                 step=100,
+                                                 help="About the width of the chart in pixels")
+                downsampling = col2.selectbox('Downsampling',
+                                              options=['minmax', 'lttb'],
+                                              help=HELP_DOWNSAMPLING)
+                first_time = dataframe['Start Time'].min().to_pydatetime()
+                last_time = dataframe['Start Time'].max().to_pydatetime()
+                time_range = (first_time, last_time)
+                if first_time < last_time:
+                    time_range = col3.slider('Time range',
+                                             min_value=first_time,
+                                             max_value=last_time,
+                                             value=(first_time, last_time),
+                                             step=TIME_RANGE_STEP,
+                                             format="YYYY-MM-DD HH:mm:ss",
+                                             help="Zoom in a range to see it with more resolution")
+                chart = line(get_line_chart_data(dataframe,
+                                                 rion_file.fingerprint,
+                                                 reduce_outliers,
+                                                 chart_points,
+                                                 downsampling,
+                                                 time_range),
+                                x="Start Time",
+                                y=['X_PPV', 'Y_PPV', 'Z_PPV', 'PVS']).update_layout(
+                                    xaxis_title = "Time [hh:mm]", 
+                                    yaxis_title = "Displacement [m/s]",
+                                    legend_title = "Metrics"
+                                )
+            if chart_type == "Box":
+                chart = box(dataframe,
+                                x=['PVS'])
+            #st.plotly_chart(chart, use_container_width=True)
+            col1, col2 = st.columns(2)
+            col1.plotly_chart(chart, use_container_width=True)
 
-def export_summary():
-    reduce_outliers = st.session_state['reduce_outliers']
-    if reduce_outliers:
-        dataframe = st.session_state.get('summary_df_non_outliers')
-    else:
-        dataframe = st.session_state.get('summary_df')
-    return export_data(dataframe)
+    def get_export_events(reduce_outliers:bool)->Optional[DataFrame]:
+        if not check_limits:
+            return None
+        return get_events(rion_objects, get_objects_key(rion_objects), reduce_outliers, limits)
 
+    def export_summary(file_format:str, include_details:bool):
+        reduce_outliers = st.session_state['reduce_outliers']
+        export_events = get_export_events(reduce_outliers)
+        if reduce_outliers:
+            dataframe = add_frequency(format_summary(summary_df_non_outliers, baseline))
+            if export_events is not None:
+                dataframe = add_events(dataframe, export_events)
+        else:
+            dataframe = summary_df
+        if not include_details:
+            return get_export(dataframe, file_format, events=export_events)
+        details, details_key = get_details(rion_objects, reduce_outliers)
+        return get_export(dataframe, file_format, details if file_format == 'xlsx' else None, details_key,
+                          export_events)
 
-st.download_button(
-    label="Download Summary",
-    data=export_summary(),
-    file_name="Vibration_summary.xlsx",
-    mime="application/vnd.ms-excel"
-)
+    if analysis.running:
+        st.caption('The summary can be downloaded once all files are processed')
+    else:
+        col1, col2, col3 = st.columns([1, 1, 2])
+        export_format = col1.selectbox('Export format', options=list(MIME_TYPES))
+        include_details = col2.checkbox('Include PPV values',
+                                        help="Add the PPV values of every file, a sheet per file in xlsx or a second file otherwise")
+        st.download_button(
+            label="Download Summary",
+            data=export_summary(export_format, include_details),
+            file_name=f"Vibration_summary.{export_format}",
+            mime=MIME_TYPES[export_format]
+        )
+        if check_limits and export_format != 'xlsx':
+            st.download_button(
+                label="Download Events",
+                data=get_export(get_export_events(st.session_state['reduce_outliers']), export_format),
+                file_name=f"Vibration_events.{export_format}",
+                mime=MIME_TYPES[export_format]
+            )
+        if include_details and export_format != 'xlsx':
+            details, details_key = get_details(rion_objects, st.session_state['reduce_outliers'])
+            st.download_button(
+                label="Download PPV values",
+                data=get_details_export(details, details_key, export_format),
+                file_name=f"Vibration_detail.{export_format}",
+                mime=MIME_TYPES[export_format]
+            )
+finally:
+    deactivate()
+
+if profiler is not None:
+    with sidebar.expander('Diagnostics', expanded=True):
+        ingestion = Profiler()
+        ingestion.extend(analysis.spans)
+        if ingestion.spans:
+            st.markdown('**Last ingestion**')
+            st.dataframe(ingestion.summary(), use_container_width=True)
+            st.dataframe(ingestion.table().pivot_table(index='file',
+                                                       columns='stage',
+                                                       values='seconds',
+                                                       aggfunc='sum'),
+                         use_container_width=True)
+        st.markdown('**This run**')
+        st.dataframe(profiler.summary(), use_container_width=True)
+        if profiler.memory_refused:
+            st.caption('Memory was not tracked, another session is tracking it')
 
 reset_button = st.button("Reset page")
 if reset_button:
     reset_page()
+
+if analysis.running:
+    sleep(POLL_SECONDS)
+    st.rerun()
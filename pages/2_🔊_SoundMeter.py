@@ -1,5 +1,132 @@
 import streamlit as st
 
-st.set_page_config(page_title="Sound Meter", page_icon="🔊")
+st.set_page_config(page_title="Sound Meter", page_icon="🔊", layout="wide")
 
+from pandas import DataFrame
+from plotly.express import line
+from data.cache import MemoryCache
+from data.downsampling import min_max_indices
+from data.export import MIME_TYPES, export_table
+from documents.documents import get_receivers_path, load_baseline, FileNotFoundError, NoFilesError
+from measurements.loaders import classify
+from measurements.noise import LEVEL_COLUMNS, get_noise_summary, noise_frame
+from measurements.vibration import file_identity
 
+#Default number of points of the line chart, about its width in pixels
+LINE_CHART_POINTS = 1000
+BASELINES_MAX_ENTRIES = 16
+BASELINES_MAX_BYTES = 64*1024**2
+
+@st.cache_resource
+def get_shared_baselines():
+    return MemoryCache(max_entries=BASELINES_MAX_ENTRIES, max_bytes=BASELINES_MAX_BYTES)
+
+@st.cache_resource(max_entries=4)
+def get_formats(_files:list, identities:tuple):
+    #Only the headers are read, ZIP archives are replaced by their members
+    return classify(_files)
+
+@st.cache_resource(max_entries=4)
+def get_noise_data(_files:list, identities:tuple, _baseline, baseline_key, level_column:str|None):
+    #The logs are shared, not copied on every rerun. Files are identified by identities
+    return get_noise_summary(_files, _baseline, level_column)
+
+@st.cache_data(max_entries=8)
+def get_export(summary:DataFrame, periods:DataFrame, file_format:str):
+    if file_format == 'xlsx':
+        return export_table(summary, file_format, {'Noise by period': periods}, sheet_name='Noise Summary')
+    return export_table(summary, file_format)
+
+st.markdown("# Sound Meter Analysis")
+sidebar = st.sidebar
+
+with st.expander('Example of folder'):
+    st.write('You can drag and drop a folder with the logs of a sound level meter like this, or a ZIP file of it')
+    code = '''
+        Noise/
+        │
+        ├── baseline.xlsx
+        ├── NL_001_SLM_Lp_0001_0001.rnd
+        .
+        .
+        .
+        └── NL_001_SLM_Lp_0020_0001.rnd
+
+    '''
+    st.code(code, language='python')
+
+uploaded_files = sidebar.file_uploader(
+    "Choose the log files or drag and drop a folder with all data.",
+    accept_multiple_files=True)
+input_container = sidebar.container(border=True)
+level_column = input_container.selectbox('Level column',
+                                         options=['Auto', *LEVEL_COLUMNS],
+                                         help="Column with the sound level, the first one found with Auto")
+col1, col2 = input_container.columns(2)
+receivers_col = col1.text_input('Receivers column', value="A")
+memories_col = col2.text_input('Memories column', value="E")
+
+uploaded_files = uploaded_files or []
+formats = get_formats(uploaded_files, tuple(file_identity(file) for file in uploaded_files))
+noise_files = formats['noise']
+if not noise_files:
+    st.warning('Please upload files')
+    st.stop()
+
+#Receivers of the 'RUIDO' sheets of the baseline workbook
+try:
+    receivers_path = get_receivers_path(uploaded_files + formats['other'])
+    baseline = load_baseline(receivers_path,
+                             get_shared_baselines(),
+                             receivers_col,
+                             memories_col,
+                             measurement='Noise')
+    baseline_key = (file_identity(receivers_path), receivers_col, memories_col)
+except (FileNotFoundError, NoFilesError):
+    st.warning('Receivers file not found')
+    baseline = None
+    baseline_key = None
+except ValueError as error:
+    st.warning(f'Receivers could not be read: {error}')
+    baseline = None
+    baseline_key = None
+
+noise = get_noise_data(noise_files,
+                       tuple(file_identity(file) for file in noise_files),
+                       baseline,
+                       baseline_key,
+                       None if level_column == 'Auto' else level_column)
+if noise.errors:
+    with st.expander(f'{len(noise.errors)} files could not be processed'):
+        st.dataframe(DataFrame.from_dict(noise.errors, orient='index', columns=['Error']),
+                     use_container_width=True)
+if not noise.logs:
+    st.error("No compatible files were uploaded.")
+    st.stop()
+
+with st.expander('Data calculated', expanded=True):
+    st.dataframe(noise.summary, use_container_width=True)
+with st.expander('Diurno and Nocturno periods'):
+    st.dataframe(noise.periods, use_container_width=True)
+
+with st.expander('Details of a specific measurement'):
+    selected = st.selectbox('Select a file to display its levels', options=list(noise.logs))
+    levels = noise_frame(noise.logs[selected])
+    chart_points = st.number_input('Chart resolution [points]',
+                                   min_value=100,
+                                   max_value=20_000,
+                                   value=LINE_CHART_POINTS,
+                                   step=100,
+                                   help="About the width of the chart in pixels")
+    chart = line(levels.iloc[min_max_indices(levels['Level'], chart_points // 2)],
+                 x='Start Time',
+                 y='Level').update_layout(xaxis_title="Time",
+                                          yaxis_title="Level [dB]")
+    st.plotly_chart(chart, use_container_width=True)
+
+col1, col2 = st.columns([1, 3])
+export_format = col1.selectbox('Export format', options=list(MIME_TYPES))
+st.download_button(label="Download Summary",
+                   data=get_export(noise.summary, noise.periods.reset_index('Period'), export_format),
+                   file_name=f"Noise_summary.{export_format}",
+                   mime=MIME_TYPES[export_format])